@@ -13,6 +13,9 @@ from api.mail import mail_bp
 from api.calendar import calendar_bp
 from api.notes import notes_bp
 from api.attachments import attachments_bp
+from api.parents import parents_bp
+from api.system import system_bp
+from api.jobs import jobs_bp
 
 __all__ = [
     'auth_bp',
@@ -23,5 +26,8 @@ __all__ = [
     'mail_bp',
     'calendar_bp',
     'notes_bp',
-    'attachments_bp'
+    'attachments_bp',
+    'parents_bp',
+    'system_bp',
+    'jobs_bp'
 ]
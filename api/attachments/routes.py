@@ -5,7 +5,7 @@ from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
 from core.extensions import db
 from core.models import Attachment
-from core.permissions import get_current_user
+from core.permissions import get_current_principal
 from core.utils import allowed_file, save_uploaded_file
 from config import Config
 
@@ -16,7 +16,7 @@ attachments_bp = Blueprint('attachments', __name__, url_prefix='/api/v1/attachme
 @jwt_required()
 def upload_file():
     """Uploader un fichier"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -68,7 +68,7 @@ def upload_file():
 @jwt_required()
 def download_file(attachment_id):
     """Télécharger un fichier si autorisé"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     attachment = Attachment.query.get(attachment_id)
     
     if not attachment:
@@ -1,9 +1,13 @@
 """Module d'authentification"""
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import (create_access_token, create_refresh_token, jwt_required, get_jwt_identity,
+                                get_jwt, decode_token)
+from jwt.exceptions import PyJWTError
+from flask_jwt_extended.exceptions import JWTExtendedException
 from core.extensions import db, bcrypt
 from core.models import User
-from core.permissions import get_current_user, admin_required
+from core.permissions import get_current_user, admin_required, build_claims
+from core.blocklist import token_blocklist
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/v1/auth')
 
@@ -62,10 +66,7 @@ def login():
         return jsonify({'error': 'Invalid credentials'}), 401
     
     # Créer les tokens avec les claims additionnels
-    additional_claims = {
-        'role': user.role,
-        'groups': [g.name for g in user.groups]
-    }
+    additional_claims = build_claims(user)
     
     access_token = create_access_token(identity=str(user.id), additional_claims=additional_claims)
     refresh_token = create_refresh_token(identity=str(user.id))
@@ -108,13 +109,25 @@ def update_me():
             return jsonify({'error': 'Invalid current password'}), 401
         
         current_user.password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        
+        # Révoquer toutes les sessions existantes, y compris le token courant
+        token_blocklist.revoke_user(current_user.id)
+        token_blocklist.revoke_token(get_jwt())
     
     db.session.commit()
     
-    return jsonify({
+    response = {
         'message': 'User updated successfully',
         'user': current_user.to_dict()
-    }), 200
+    }
+    
+    # Nouveaux tokens pour la session en cours après un changement de mot de passe
+    if 'password' in data:
+        response['access_token'] = create_access_token(identity=str(current_user.id),
+                                                       additional_claims=build_claims(current_user))
+        response['refresh_token'] = create_refresh_token(identity=str(current_user.id))
+    
+    return jsonify(response), 200
 
 
 @auth_bp.route('/refresh', methods=['POST'])
@@ -127,11 +140,30 @@ def refresh():
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    additional_claims = {
-        'role': user.role,
-        'groups': [g.name for g in user.groups]
-    }
+    additional_claims = build_claims(user)
     
     access_token = create_access_token(identity=str(current_user_id), additional_claims=additional_claims)
     
     return jsonify({'access_token': access_token}), 200
+
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """Révoquer le token courant (et le refresh token fourni, le cas échéant)"""
+    token = get_jwt()
+    token_blocklist.revoke_token(token)
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        try:
+            refresh_token = decode_token(data['refresh_token'])
+        except (PyJWTError, JWTExtendedException):
+            return jsonify({'error': 'Invalid refresh token'}), 400
+        if refresh_token['sub'] != token['sub']:
+            return jsonify({'error': 'Invalid refresh token'}), 400
+        token_blocklist.revoke_token(refresh_token)
+    
+    db.session.commit()
+    
+    return jsonify({'message': 'Logged out successfully'}), 200
@@ -1,103 +1,370 @@
 """Module de gestion du calendrier"""
-from flask import Blueprint, request, jsonify
+import os
+import uuid
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
-from icalendar import Calendar
 from datetime import datetime, timedelta
+from sqlalchemy import delete, select
 from core.extensions import db
-from core.models import CalendarEvent, Group, User
-from core.permissions import get_current_user, admin_required, prof_or_admin_required
+from core.models import CalendarEvent, CalendarSubscription, Group, event_groups
+from core.membership import membership_index
+from core.permissions import (get_current_principal, admin_required, prof_or_admin_required,
+                              user_in_group, is_parent_of_child, group_ids_of_users)
+from core.streaming import stream_mode, stream_query
+from core.pagination import Keyset
+from core.cache import response_cache
+from core.utils import validate_date
+from core.jobs import jobs
+from core.ics_import import IcsImporter, delete_events
+from core.subscriptions import on_change, validate_url, sync_subscription
+from core.recurrence import (LEGACY_RULES, expand_events, normalize_rule, legacy_rule, series_end,
+                             is_occurrence, add_exdate, format_exdates, parse_exdates)
 
 calendar_bp = Blueprint('calendar', __name__, url_prefix='/api/v1/calendar')
 
+# Étiquette des réponses en cache qui portent sur tous les groupes (admin)
+ALL_EVENTS_TAG = 'calendar:all'
+
+# Intervalle minimal entre deux synchronisations d'un abonnement (minutes)
+MIN_SYNC_INTERVAL = 5
+
+
+def _group_tag(group_id):
+    """Étiquette de cache des événements d'un groupe"""
+    return f'calendar:group:{group_id}'
+
+
+@on_change
+def _invalidate_events(*group_ids):
+    """Invalide les réponses en cache des groupes modifiés"""
+    response_cache.invalidate(ALL_EVENTS_TAG, *[_group_tag(g) for g in set(group_ids)])
+
+
+def _date_window():
+    """Période demandée: ?week=current|AAAA-MM-JJ (lundi au lundi suivant) ou ?start=&end=
+
+    Renvoie (début, fin, semaine); début et fin peuvent être None. ValueError si invalide.
+    """
+    week = request.args.get('week')
+    if week:
+        day = datetime.utcnow() if week == 'current' else validate_date(week)
+        if not day:
+            raise ValueError('Invalid week')
+        monday = (day - timedelta(days=day.weekday())).replace(hour=0, minute=0, second=0,
+                                                               microsecond=0, tzinfo=None)
+        return monday, monday + timedelta(days=7), True
+    
+    bounds = []
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        parsed = validate_date(value) if value is not None else None
+        if value is not None and not parsed:
+            raise ValueError('Invalid date format')
+        bounds.append(parsed.replace(tzinfo=None) if parsed else None)
+    if bounds[0] and bounds[1] and bounds[1] <= bounds[0]:
+        raise ValueError('Invalid date range')
+    return bounds[0], bounds[1], False
+
 
 @calendar_bp.route('', methods=['GET'])
 @jwt_required()
 def list_events():
     """Lister les événements pour les groupes de l'utilisateur (ou des enfants pour les parents)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     # Paramètre optionnel pour les parents: child_id
     child_id = request.args.get('child_id', type=int)
     
+    try:
+        start, end, is_week = _date_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Charger en amont les relations utilisées par to_dict
+    query = CalendarEvent.query.options(*CalendarEvent.eager_options())
+    group_ids = None
+    
     if current_user.role == 'admin':
-        events = CalendarEvent.query.all()
+        pass
     elif current_user.role == 'parent':
         # Parent voit l'emploi du temps de ses enfants
         if child_id:
             # Vérifier que l'enfant appartient bien au parent
-            child = User.query.get(child_id)
-            if not child or child not in current_user.children:
+            if not is_parent_of_child(current_user, child_id):
                 return jsonify({'error': 'Child not found or not associated with your account'}), 403
-            group_ids = [g.id for g in child.groups]
+            group_ids = group_ids_of_users([child_id])
         else:
             # Récupérer tous les emplois du temps de tous les enfants
-            group_ids = []
-            for child in current_user.children:
-                group_ids.extend([g.id for g in child.groups])
-            group_ids = list(set(group_ids))  # Supprimer les doublons
-        events = CalendarEvent.query.filter(CalendarEvent.group_id.in_(group_ids)).all() if group_ids else []
+            group_ids = group_ids_of_users(membership_index.children_of(current_user.id))
+        query = query.filter(CalendarEvent.of_groups(group_ids))
     else:
         # Récupérer les événements des groupes de l'utilisateur
-        group_ids = [g.id for g in current_user.groups]
-        events = CalendarEvent.query.filter(CalendarEvent.group_id.in_(group_ids)).all()
+        group_ids = list(membership_index.groups_of(current_user.id))
+        query = query.filter(CalendarEvent.of_groups(group_ids))
     
-    return jsonify({
-        'events': [e.to_dict() for e in events]
-    }), 200
+    # Événements et séries qui chevauchent la période
+    query = query.filter(*CalendarEvent.window_filter(start, end))
+    
+    # Réponse en flux et pagination: lignes stockées, séries non développées
+    mode = stream_mode()
+    if mode:
+        return stream_query(query.order_by(CalendarEvent.id), CalendarEvent.to_dict, 'events', mode)
+    
+    pager = Keyset.from_request()
+    if is_week and not pager:
+        # Vue semaine: réponse mise en cache par utilisateur jusqu'à la prochaine
+        # modification d'un événement de ses groupes
+        def compute():
+            return expand_events(query.all(), start, end)
+        
+        groups_key = tuple(sorted(group_ids)) if group_ids is not None else None
+        key = ('calendar_week', current_user.id, child_id, groups_key, start.date())
+        tags = [_group_tag(g) for g in group_ids] if group_ids is not None else [ALL_EVENTS_TAG]
+        return jsonify({
+            'events': response_cache.get_or_set(key, compute, tags=tags),
+            'start': start.isoformat(),
+            'end': end.isoformat()
+        }), 200
+    
+    if pager:
+        events = pager.paginate(pager.apply(query, [CalendarEvent.start_time, CalendarEvent.id]).all())
+        return jsonify({
+            'events': [e.to_dict() for e in events],
+            **pager.meta()
+        }), 200
+    
+    # Occurrences des séries calculées sur la période
+    return jsonify({'events': expand_events(query.all(), start, end)}), 200
+
+
+def _import_ics(stream, group_id, progress=None):
+    """Importe un flux .ics dans le groupe (une transaction); renvoie les compteurs"""
+    importer = IcsImporter(group_id, current_app.config.get('ICS_IMPORT_BATCH_SIZE', 500))
+    try:
+        counts = importer.run(stream, progress)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    _invalidate_events(group_id)
+    return counts
+
+
+def _import_ics_job(job, path, group_id):
+    """Tâche de fond: import d'un fichier .ics volumineux déposé sur disque"""
+    try:
+        with open(path, 'rb') as stream:
+            return _import_ics(stream, group_id, progress=job.progress)
+    finally:
+        os.remove(path)
 
 
 @calendar_bp.route('/import', methods=['POST'])
 @jwt_required()
 @admin_required
 def import_ics():
-    """Importer un fichier .ics pour un groupe (admin uniquement)"""
+    """Importer un fichier .ics pour un groupe (admin uniquement), mise à jour par UID"""
+    current_user = get_current_principal()
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
     file = request.files['file']
-    group_id = request.form.get('group_id')
+    group_id = request.form.get('group_id', type=int)
     
     if not group_id:
         return jsonify({'error': 'Missing group_id'}), 400
     
-    group = Group.query.get(group_id)
+    group = db.session.get(Group, group_id)
     if not group:
         return jsonify({'error': 'Group not found'}), 404
     
     if not file.filename.endswith('.ics'):
         return jsonify({'error': 'File must be .ics format'}), 400
     
-    try:
-        # Lire et parser le fichier ICS
-        ics_content = file.read()
-        cal = Calendar.from_ical(ics_content)
-        
-        events_created = 0
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                event = CalendarEvent(
-                    title=str(component.get('summary', 'Sans titre')),
-                    description=str(component.get('description', '')),
-                    start_time=component.get('dtstart').dt,
-                    end_time=component.get('dtend').dt,
-                    location=str(component.get('location', '')),
-                    group_id=group_id
-                )
-                db.session.add(event)
-                events_created += 1
-        
-        db.session.commit()
-        
-        return jsonify({
-            'message': f'{events_created} events imported successfully'
-        }), 201
+    # Gros fichiers: copiés sur disque et importés en tâche de fond
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    if size > current_app.config.get('ICS_IMPORT_ASYNC_BYTES', 1024 * 1024):
+        folder = current_app.config['UPLOAD_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'import_{uuid.uuid4().hex}.ics')
+        file.save(path)
+        job = jobs.submit('ics_import', current_user.id, _import_ics_job, path, group.id)
+        return jsonify(job.to_dict()), 202
     
+    try:
+        counts = _import_ics(file.stream, group.id)
     except Exception as e:
-        db.session.rollback()
         # Log the error for debugging but don't expose stack trace
         import logging
         logging.error(f'Failed to import calendar: {str(e)}')
         return jsonify({'error': 'Failed to import calendar'}), 400
+    
+    return jsonify({
+        'message': f'{counts["created"] + counts["updated"]} events imported successfully',
+        **counts
+    }), 201
+
+
+def _subscription_settings(data, subscription):
+    """Applique url, interval_minutes et enabled (ValueError si invalides)"""
+    if 'url' in data:
+        url = validate_url((data['url'] or '').strip())
+        if url != subscription.url:
+            # Nouvelle source: les validateurs de l'ancienne ne s'appliquent plus
+            subscription.url, subscription.etag, subscription.last_modified = url, None, None
+    if 'interval_minutes' in data:
+        interval = data['interval_minutes']
+        if not isinstance(interval, int) or isinstance(interval, bool) or interval < MIN_SYNC_INTERVAL:
+            raise ValueError(f'interval_minutes must be an integer >= {MIN_SYNC_INTERVAL}')
+        subscription.interval_minutes = interval
+    if 'enabled' in data:
+        subscription.enabled = bool(data['enabled'])
+
+
+@calendar_bp.route('/subscriptions', methods=['GET'])
+@jwt_required()
+@admin_required
+def list_subscriptions():
+    """Lister les abonnements .ics (admin uniquement)"""
+    subscriptions = CalendarSubscription.query.order_by(CalendarSubscription.id).all()
+    return jsonify({'subscriptions': [s.to_dict() for s in subscriptions]}), 200
+
+
+@calendar_bp.route('/subscriptions', methods=['POST'])
+@jwt_required()
+@admin_required
+def create_subscription():
+    """Abonner un groupe à un calendrier .ics publié (admin uniquement)"""
+    current_user = get_current_principal()
+    data = request.get_json(silent=True) or {}
+    
+    if not data.get('url') or not data.get('group_id'):
+        return jsonify({'error': 'Missing url or group_id'}), 400
+    
+    group = db.session.get(Group, data['group_id'])
+    if not group:
+        return jsonify({'error': 'Group not found'}), 404
+    
+    subscription = CalendarSubscription(group_id=group.id, created_by=current_user.id)
+    try:
+        _subscription_settings(data, subscription)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.add(subscription)
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Subscription created successfully',
+        'subscription': subscription.to_dict()
+    }), 201
+
+
+@calendar_bp.route('/subscriptions/<int:subscription_id>', methods=['PUT'])
+@jwt_required()
+@admin_required
+def update_subscription(subscription_id):
+    """Modifier un abonnement .ics (admin uniquement)"""
+    subscription = db.session.get(CalendarSubscription, subscription_id)
+    if not subscription:
+        return jsonify({'error': 'Subscription not found'}), 404
+    
+    try:
+        _subscription_settings(request.get_json(silent=True) or {}, subscription)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Subscription updated successfully',
+        'subscription': subscription.to_dict()
+    }), 200
+
+
+@calendar_bp.route('/subscriptions/<int:subscription_id>', methods=['DELETE'])
+@jwt_required()
+@admin_required
+def delete_subscription(subscription_id):
+    """Supprimer un abonnement .ics et ses événements (admin uniquement)"""
+    subscription = db.session.get(CalendarSubscription, subscription_id)
+    if not subscription:
+        return jsonify({'error': 'Subscription not found'}), 404
+    
+    group_id = subscription.group_id
+    event_ids = db.session.execute(
+        select(CalendarEvent.id).where(CalendarEvent.subscription_id == subscription.id)
+    ).scalars().all()
+    deleted_count = delete_events(event_ids)
+    db.session.delete(subscription)
+    db.session.commit()
+    _invalidate_events(group_id)
+    
+    return jsonify({
+        'message': f'Subscription deleted with {deleted_count} event(s)'
+    }), 200
+
+
+@calendar_bp.route('/subscriptions/<int:subscription_id>/sync', methods=['POST'])
+@jwt_required()
+@admin_required
+def sync_subscription_now(subscription_id):
+    """Synchroniser un abonnement immédiatement (admin uniquement)"""
+    subscription = db.session.get(CalendarSubscription, subscription_id)
+    if not subscription:
+        return jsonify({'error': 'Subscription not found'}), 404
+    
+    result = sync_subscription(subscription)
+    if result['status'] == 'error':
+        return jsonify({'error': 'Failed to sync calendar', 'subscription': subscription.to_dict()}), 502
+    
+    return jsonify({**result, 'subscription': subscription.to_dict()}), 200
+
+
+def _parse_datetime(value):
+    """Date ISO 8601 en UTC sans fuseau (ValueError si invalide)"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _apply_rule(event, rule, exdates=None):
+    """Fait de l'événement une série (ou un événement simple si rule est vide)"""
+    if not rule:
+        event.rrule = None
+        event.exdates = None
+        event.is_recurring = False
+        event.recurrence_end = None
+        return
+    
+    # Les exdates sont stockées à la seconde
+    event.start_time = event.start_time.replace(microsecond=0)
+    event.rrule = normalize_rule(rule, event.start_time)
+    if exdates is not None:
+        event.exdates = format_exdates(_parse_datetime(d) for d in exdates)
+    event.is_recurring = True
+    event.recurrence_end = series_end(event.rrule, event.start_time, event.end_time - event.start_time)
+    event.sequence = (event.sequence or 0) + 1
+
+
+def _occurrence_of(event, value):
+    """Début d'occurrence demandé pour une série (ValueError si ce n'en est pas une)"""
+    if not event.rrule:
+        raise ValueError('Event is not recurring')
+    occurrence = validate_date(value)
+    if not occurrence or not is_occurrence(event, occurrence.replace(tzinfo=None)):
+        raise ValueError('Invalid occurrence')
+    return occurrence.replace(tzinfo=None)
+
+
+def _override_of(event, occurrence):
+    """Occurrence modifiée existante de la série (None s'il n'y en a pas)"""
+    return CalendarEvent.query.filter_by(parent_event_id=event.id, recurrence_id=occurrence).first()
+
+
+def _is_cancelled(event, occurrence):
+    """L'occurrence est-elle exclue de la série ?"""
+    return occurrence in parse_exdates(event.exdates)
 
 
 @calendar_bp.route('', methods=['POST'])
@@ -105,7 +372,7 @@ def import_ics():
 @prof_or_admin_required
 def create_event():
     """Créer un événement (prof uniquement, pour ses groupes)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     data = request.get_json()
     
     # Validation
@@ -119,19 +386,21 @@ def create_event():
         return jsonify({'error': 'At least one group must be selected'}), 400
     
     # Vérifier que l'utilisateur appartient aux groupes sélectionnés
-    user_group_ids = [g.id for g in current_user.groups]
+    groups = []
     for group_id in group_ids:
-        if group_id not in user_group_ids:
+        if not user_in_group(current_user, group_id):
             return jsonify({'error': f'You are not a member of group {group_id}'}), 403
         
         # Vérifier que le groupe existe
         group = Group.query.get(group_id)
         if not group:
             return jsonify({'error': f'Group {group_id} not found'}), 404
+        if group not in groups:
+            groups.append(group)
     
     try:
-        start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
-        end_time = datetime.fromisoformat(data['end_time'].replace('Z', '+00:00'))
+        start_time = _parse_datetime(data['start_time'])
+        end_time = _parse_datetime(data['end_time'])
         
         # Vérifier que start_time < end_time
         if start_time >= end_time:
@@ -139,46 +408,41 @@ def create_event():
         
         is_recurring = data.get('is_recurring', False)
         recurrence_type = data.get('recurrence_type')
-        recurrence_end = datetime.fromisoformat(data['recurrence_end'].replace('Z', '+00:00')) if data.get('recurrence_end') else None
-        
-        total_created = 0
-        all_created_events = []
-        
-        # Créer un événement pour chaque groupe sélectionné
-        for group_id in group_ids:
-            # Créer l'événement principal
-            event = CalendarEvent(
-                title=data['title'],
-                description=data.get('description', ''),
-                start_time=start_time,
-                end_time=end_time,
-                location=data.get('location', ''),
-                group_id=group_id,
-                created_by=current_user.id,
-                is_recurring=is_recurring,
-                recurrence_type=recurrence_type,
-                recurrence_end=recurrence_end
-            )
-            db.session.add(event)
-            db.session.flush()  # Pour obtenir l'ID
-            
-            # Créer les événements récurrents si nécessaire
-            created_events = [event]
-            if event.is_recurring and event.recurrence_type and event.recurrence_end:
-                created_events.extend(_create_recurring_instances(event))
-            
-            total_created += len(created_events)
-            all_created_events.append(event)
-        
+        recurrence_end = _parse_datetime(data['recurrence_end']) if data.get('recurrence_end') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid datetime format: {str(e)}'}), 400
+    
+    # Série stockée en une ligne: règle RRULE explicite, ou déduite de recurrence_type
+    rule = data.get('rrule')
+    if not rule and is_recurring and recurrence_type in LEGACY_RULES and recurrence_end:
+        rule = legacy_rule(recurrence_type, recurrence_end)
+    
+    try:
+        # Un seul événement partagé par tous les groupes sélectionnés
+        event = CalendarEvent(
+            title=data['title'],
+            description=data.get('description', ''),
+            start_time=start_time,
+            end_time=end_time,
+            location=data.get('location', ''),
+            group_id=groups[0].id,
+            groups=groups,
+            created_by=current_user.id,
+            recurrence_type=recurrence_type if rule else None
+        )
+        _apply_rule(event, rule, data.get('exdates', []))
+        db.session.add(event)
         db.session.commit()
+        _invalidate_events(*[g.id for g in groups])
         
         return jsonify({
-            'message': f'{total_created} event(s) created successfully for {len(group_ids)} group(s)',
-            'events': [e.to_dict() for e in all_created_events]
+            'message': f'1 event(s) created successfully for {len(groups)} group(s)',
+            'events': [event.to_dict()]
         }), 201
         
     except ValueError as e:
-        return jsonify({'error': f'Invalid datetime format: {str(e)}'}), 400
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         import logging
@@ -186,55 +450,12 @@ def create_event():
         return jsonify({'error': 'Failed to create event'}), 400
 
 
-def _create_recurring_instances(parent_event):
-    """Créer les instances d'un événement récurrent"""
-    instances = []
-    current_date = parent_event.start_time
-    duration = parent_event.end_time - parent_event.start_time
-    
-    # Déterminer l'incrément selon le type de récurrence
-    if parent_event.recurrence_type == 'weekly':
-        delta = timedelta(weeks=1)
-    elif parent_event.recurrence_type == 'biweekly':
-        delta = timedelta(weeks=2)
-    elif parent_event.recurrence_type == 'monthly':
-        delta = timedelta(days=30)  # Approximation
-    else:
-        return instances
-    
-    # Générer les instances (maximum 52 pour éviter les abus)
-    max_instances = 52
-    count = 0
-    
-    while count < max_instances:
-        current_date += delta
-        if current_date > parent_event.recurrence_end:
-            break
-        
-        instance = CalendarEvent(
-            title=parent_event.title,
-            description=parent_event.description,
-            start_time=current_date,
-            end_time=current_date + duration,
-            location=parent_event.location,
-            group_id=parent_event.group_id,
-            created_by=parent_event.created_by,
-            is_recurring=False,
-            parent_event_id=parent_event.id
-        )
-        db.session.add(instance)
-        instances.append(instance)
-        count += 1
-    
-    return instances
-
-
 @calendar_bp.route('/<int:event_id>', methods=['PUT'])
 @jwt_required()
 @prof_or_admin_required
 def update_event(event_id):
-    """Mettre à jour un événement (prof uniquement pour ses propres cours)"""
-    current_user = get_current_user()
+    """Mettre à jour un événement, une série ou une occurrence (prof uniquement pour ses propres cours)"""
+    current_user = get_current_principal()
     event = CalendarEvent.query.get(event_id)
     
     if not event:
@@ -245,33 +466,79 @@ def update_event(event_id):
         return jsonify({'error': 'You can only modify your own courses'}), 403
     
     data = request.get_json()
+    old_group_ids = [g.id for g in event.groups]
     
     try:
+        target = event
+        if data.get('occurrence'):
+            # Occurrence modifiée: ligne distincte, exclue de la série (réutilisée si elle existe)
+            occurrence = _occurrence_of(event, data['occurrence'])
+            target = _override_of(event, occurrence)
+            if target is None and _is_cancelled(event, occurrence):
+                return jsonify({'error': 'Occurrence has been deleted'}), 409
+            if target is not None:
+                old_group_ids += [g.id for g in target.groups]
+        if target is None:
+            target = CalendarEvent(
+                title=event.title,
+                description=event.description,
+                start_time=occurrence,
+                end_time=occurrence + (event.end_time - event.start_time),
+                location=event.location,
+                group_id=event.group_id,
+                groups=list(event.groups),
+                created_by=event.created_by,
+                parent_event_id=event.id,
+                recurrence_id=occurrence
+            )
+            add_exdate(event, occurrence)
+            db.session.add(target)
+        
         if 'title' in data:
-            event.title = data['title']
+            target.title = data['title']
         if 'description' in data:
-            event.description = data['description']
+            target.description = data['description']
         if 'start_time' in data:
-            event.start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
+            target.start_time = _parse_datetime(data['start_time'])
         if 'end_time' in data:
-            event.end_time = datetime.fromisoformat(data['end_time'].replace('Z', '+00:00'))
+            target.end_time = _parse_datetime(data['end_time'])
         if 'location' in data:
-            event.location = data['location']
-        if 'group_id' in data:
-            group = Group.query.get(data['group_id'])
-            if not group:
-                return jsonify({'error': 'Group not found'}), 404
-            event.group_id = data['group_id']
+            target.location = data['location']
+        if 'group_ids' in data or 'group_id' in data:
+            # group_id (ancien format): l'événement passe dans ce seul groupe
+            new_ids = data['group_ids'] if 'group_ids' in data else [data['group_id']]
+            if not isinstance(new_ids, list) or not new_ids:
+                db.session.rollback()
+                return jsonify({'error': 'At least one group must be selected'}), 400
+            groups = []
+            for group_id in new_ids:
+                group = Group.query.get(group_id)
+                if not group:
+                    db.session.rollback()
+                    return jsonify({'error': f'Group {group_id} not found'}), 404
+                if current_user.role == 'prof' and not user_in_group(current_user, group.id):
+                    db.session.rollback()
+                    return jsonify({'error': f'You are not a member of group {group.id}'}), 403
+                if group not in groups:
+                    groups.append(group)
+            target.groups = groups
+            target.group_id = groups[0].id
+        
+        # Série modifiée: règle revalidée, bornes recalculées, nouvelle version
+        if target is event and (event.rrule or 'rrule' in data):
+            _apply_rule(event, data.get('rrule', event.rrule), data.get('exdates'))
         
         db.session.commit()
+        _invalidate_events(*old_group_ids, *[g.id for g in target.groups])
         
         return jsonify({
             'message': 'Event updated successfully',
-            'event': event.to_dict()
+            'event': target.to_dict()
         }), 200
         
     except ValueError as e:
-        return jsonify({'error': f'Invalid datetime format: {str(e)}'}), 400
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         import logging
@@ -283,9 +550,9 @@ def update_event(event_id):
 @jwt_required()
 @prof_or_admin_required
 def delete_event(event_id):
-    """Supprimer un événement (prof uniquement pour ses propres cours)"""
-    current_user = get_current_user()
-    data = request.get_json() or {}
+    """Supprimer un événement, une série ou une occurrence (prof uniquement pour ses propres cours)"""
+    current_user = get_current_principal()
+    data = request.get_json(silent=True) or {}
     delete_series = data.get('delete_series', False)
     
     event = CalendarEvent.query.get(event_id)
@@ -296,28 +563,39 @@ def delete_event(event_id):
     if event.created_by != current_user.id:
         return jsonify({'error': 'You can only delete your own courses'}), 403
     
+    group_ids = [g.id for g in event.groups]
     deleted_count = 1
     
-    # Si c'est un événement parent récurrent et qu'on veut supprimer toute la série
-    if delete_series and event.is_recurring:
-        # Supprimer toutes les instances
-        CalendarEvent.query.filter_by(parent_event_id=event.id).delete()
-        deleted_count += CalendarEvent.query.filter_by(parent_event_id=event.id).count()
-    
-    # Si c'est une instance et qu'on veut supprimer toute la série
-    if delete_series and event.parent_event_id:
-        parent = CalendarEvent.query.get(event.parent_event_id)
-        if parent:
-            # Supprimer le parent et toutes ses instances
-            CalendarEvent.query.filter_by(parent_event_id=parent.id).delete()
-            deleted_count = CalendarEvent.query.filter_by(parent_event_id=parent.id).count() + 1
-            db.session.delete(parent)
-        db.session.delete(event)
+    if event.rrule and data.get('occurrence') and not delete_series:
+        # Une seule occurrence: ajoutée aux dates exclues de la série
+        try:
+            occurrence = _occurrence_of(event, data['occurrence'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        override = _override_of(event, occurrence)
+        if override is not None:
+            # Occurrence déjà modifiée (donc exclue): supprimer sa ligne
+            group_ids += [g.id for g in override.groups]
+            db.session.delete(override)
+        elif _is_cancelled(event, occurrence):
+            return jsonify({'error': 'Occurrence not found'}), 404
+        else:
+            add_exdate(event, occurrence)
     else:
-        # Supprimer uniquement cet événement
+        # Depuis une occurrence modifiée, delete_series remonte à la série
+        if delete_series and event.parent_event_id:
+            event = CalendarEvent.query.get(event.parent_event_id) or event
+            group_ids += [g.id for g in event.groups]
+        
+        # Une série est supprimée avec ses occurrences modifiées (et leurs groupes)
+        if event.rrule or event.is_recurring:
+            instances = select(CalendarEvent.id).where(CalendarEvent.parent_event_id == event.id)
+            db.session.execute(delete(event_groups).where(event_groups.c.event_id.in_(instances)))
+            deleted_count += CalendarEvent.query.filter_by(parent_event_id=event.id).delete()
         db.session.delete(event)
     
     db.session.commit()
+    _invalidate_events(*group_ids)
     
     return jsonify({
         'message': f'{deleted_count} event(s) deleted successfully'
@@ -3,7 +3,8 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from core.extensions import db
 from core.models import Announcement
-from core.permissions import get_current_user, admin_required
+from core.permissions import get_current_principal, admin_required
+from core.pagination import Keyset
 
 feed_bp = Blueprint('feed', __name__, url_prefix='/api/v1/feed')
 
@@ -11,11 +12,23 @@ feed_bp = Blueprint('feed', __name__, url_prefix='/api/v1/feed')
 @feed_bp.route('', methods=['GET'])
 @jwt_required()
 def list_announcements():
-    """Lister les annonces visibles"""
+    """Lister les annonces visibles (par curseur avec ?limit=/?cursor=, sinon par page)"""
+    query = Announcement.query.options(*Announcement.eager_options())
+    
+    pager = Keyset.from_request()
+    if pager:
+        announcements = pager.paginate(
+            pager.apply(query, [Announcement.created_at, Announcement.id], descending=True).all()
+        )
+        return jsonify({
+            'announcements': [a.to_dict() for a in announcements],
+            **pager.meta()
+        }), 200
+    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).paginate(
+    announcements = query.order_by(Announcement.created_at.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
@@ -33,7 +46,7 @@ def list_announcements():
 @admin_required
 def create_announcement():
     """Publier une annonce (admin uniquement)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     data = request.get_json()
     
     # Validation
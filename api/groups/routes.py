@@ -3,7 +3,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from core.extensions import db
 from core.models import Group
-from core.permissions import get_current_user, admin_required
+from core.membership import membership_index
+from core.permissions import get_current_principal, admin_required, bump_claims_version
+from core.streaming import stream_mode, stream_query
 
 groups_bp = Blueprint('groups', __name__, url_prefix='/api/v1/groups')
 
@@ -12,12 +14,20 @@ groups_bp = Blueprint('groups', __name__, url_prefix='/api/v1/groups')
 @jwt_required()
 def list_groups():
     """Lister les groupes (admin: tous, autres: leurs groupes)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
-    if current_user.role == 'admin':
-        groups = Group.query.all()
-    else:
-        groups = current_user.groups
+    # Charger les membres en une requête pour tous les groupes
+    query = Group.query.options(*Group.eager_options())
+    
+    if current_user.role != 'admin':
+        query = query.filter(Group.id.in_(membership_index.groups_of(current_user.id)))
+    
+    # Réponse en flux pour les grandes collections (NDJSON ou ?stream=1)
+    mode = stream_mode()
+    if mode:
+        return stream_query(query.order_by(Group.id), Group.to_dict, 'groups', mode)
+    
+    groups = query.all()
     
     return jsonify({
         'groups': [g.to_dict(include_members=True) for g in groups]
@@ -107,6 +117,14 @@ def delete_group(group_id):
     if not group:
         return jsonify({'error': 'Group not found'}), 404
     
+    # Les membres perdent ce groupe: leurs claims sont périmés
+    bump_claims_version(*[m.id for m in group.members])
+    
+    # Événements partagés avec d'autres groupes: conservés, avec un autre groupe principal
+    for event in list(group.events):
+        others = [g for g in event.groups if g.id != group.id]
+        if others:
+            event.group = others[0]
     db.session.delete(group)
     db.session.commit()
     
@@ -1,20 +1,69 @@
 """Module de gestion des devoirs"""
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
+from sqlalchemy import and_, delete, exists, false, func, insert, literal, select
 from core.extensions import db
-from core.models import Homework, Group, User
-from core.permissions import get_current_user, prof_or_admin_required, user_in_group
+from core.models import Homework, Group, User, homework_completions, user_groups
+from core.membership import membership_index
+from core.permissions import (get_current_principal, prof_or_admin_required, user_in_group,
+                              is_parent_of_child, group_ids_of_users)
 from core.utils import validate_date
-from datetime import datetime
+from core.pagination import Keyset
+from core.write_batcher import write_batcher
+from core.cache import response_cache
+from datetime import datetime, timedelta
 
 homeworks_bp = Blueprint('homeworks', __name__, url_prefix='/api/v1/homeworks')
 
 
+def _completion_exists(homework_id, user_id):
+    """Condition « l'élève a complété le devoir »"""
+    return exists().where(
+        homework_completions.c.homework_id == homework_id,
+        homework_completions.c.user_id == user_id
+    )
+
+
+def _set_completion(homework_id, user_id, completed):
+    """Instruction idempotente qui marque le devoir comme fait ou non fait"""
+    if not completed:
+        return delete(homework_completions).where(
+            homework_completions.c.homework_id == homework_id,
+            homework_completions.c.user_id == user_id
+        )
+    # INSERT ... SELECT ... WHERE NOT EXISTS: sans effet si la ligne existe déjà
+    row = select(literal(homework_id), literal(user_id), literal(datetime.utcnow())).where(
+        ~_completion_exists(homework_id, user_id)
+    )
+    return insert(homework_completions).from_select(['homework_id', 'user_id', 'completed_at'], row)
+
+
+def _group_tag(group_id):
+    """Étiquette de cache des agrégats de devoirs d'un groupe"""
+    return f'homeworks:group:{group_id}'
+
+
+def _is_completed(homework_id, user_id):
+    """L'élève a-t-il complété le devoir ? (une requête EXISTS)"""
+    return db.session.query(_completion_exists(homework_id, user_id)).scalar()
+
+
+def _check_completion_access(principal, group_id):
+    """Erreur (message, code) si l'utilisateur ne peut pas cocher un devoir du groupe"""
+    # Seuls les élèves peuvent marquer des devoirs comme complétés
+    if principal.role != 'eleve':
+        return 'Only students can mark homeworks as completed', 403
+    # Vérifier que l'utilisateur est dans le groupe du devoir
+    if not user_in_group(principal, group_id):
+        return 'You are not in this homework group', 403
+    return None
+
+
 @homeworks_bp.route('', methods=['GET'])
 @jwt_required()
 def list_homeworks():
     """Lister les devoirs selon le rôle de l'utilisateur"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     # Paramètres de filtrage
     status = request.args.get('status')  # 'all', 'pending', 'completed', 'overdue'
@@ -31,23 +80,19 @@ def list_homeworks():
         # Parent voit les devoirs de ses enfants
         if child_id:
             # Vérifier que l'enfant appartient bien au parent
-            child = User.query.get(child_id)
-            if not child or child not in current_user.children:
+            if not is_parent_of_child(current_user, child_id):
                 return jsonify({'error': 'Child not found or not associated with your account'}), 403
-            group_ids = [g.id for g in child.groups]
+            group_ids = group_ids_of_users([child_id])
         else:
             # Récupérer tous les devoirs de tous les enfants
-            group_ids = []
-            for child in current_user.children:
-                group_ids.extend([g.id for g in child.groups])
-            group_ids = list(set(group_ids))  # Supprimer les doublons
+            group_ids = group_ids_of_users(membership_index.children_of(current_user.id))
         
         if not group_ids:
             return jsonify({'homeworks': []}), 200
         query = Homework.query.filter(Homework.group_id.in_(group_ids))
     else:
         # Élève voit les devoirs des groupes auxquels il appartient
-        group_ids = [g.id for g in current_user.groups]
+        group_ids = list(membership_index.groups_of(current_user.id))
         if not group_ids:
             return jsonify({'homeworks': []}), 200
         query = Homework.query.filter(Homework.group_id.in_(group_ids))
@@ -56,36 +101,41 @@ def list_homeworks():
     if group_id:
         query = query.filter(Homework.group_id == int(group_id))
     
-    homeworks = query.order_by(Homework.due_date.asc()).all()
+    # Pour les parents, la complétion est celle de l'enfant sélectionné
+    target_user_id = child_id if current_user.role == 'parent' and child_id else current_user.id
+    
+    # Complétion calculée par jointure externe sur la ligne de l'utilisateur cible
+    completed = homework_completions.c.user_id.isnot(None)
+    query = query.outerjoin(homework_completions, and_(
+        homework_completions.c.homework_id == Homework.id,
+        homework_completions.c.user_id == target_user_id
+    )).add_columns(completed.label('is_completed'))
     
     # Filtrer par statut (uniquement pour les élèves et parents)
     if status and current_user.role in ['eleve', 'parent']:
         now = datetime.utcnow()
-        filtered_homeworks = []
-        
-        # Pour les parents, utiliser l'enfant sélectionné
-        user_id_for_check = child_id if current_user.role == 'parent' and child_id else current_user.id
-        
-        for h in homeworks:
-            is_completed = any(u.id == user_id_for_check for u in h.completed_by)
-            is_overdue = h.due_date < now
-            
-            if status == 'completed' and is_completed:
-                filtered_homeworks.append(h)
-            elif status == 'overdue' and is_overdue and not is_completed:
-                filtered_homeworks.append(h)
-            elif status == 'pending' and not is_completed and not is_overdue:
-                filtered_homeworks.append(h)
-            elif status == 'all':
-                filtered_homeworks.append(h)
-        
-        homeworks = filtered_homeworks
-    
-    # Utiliser l'ID approprié pour vérifier la complétion
-    user_id_for_dict = child_id if current_user.role == 'parent' and child_id else current_user.id
+        if status == 'completed':
+            query = query.filter(completed)
+        elif status == 'overdue':
+            query = query.filter(~completed, Homework.due_date < now)
+        elif status == 'pending':
+            query = query.filter(~completed, Homework.due_date >= now)
+        elif status != 'all':
+            query = query.filter(false())
+    
+    # Charger en amont les relations utilisées par to_dict
+    query = query.options(*Homework.eager_options())
+    
+    pager = Keyset.from_request()
+    if pager:
+        rows = pager.paginate(pager.apply(query, [Homework.due_date, Homework.id]).all(),
+                              key_of=lambda row: (row.Homework.due_date, row.Homework.id))
+    else:
+        rows = query.order_by(Homework.due_date.asc()).all()
     
     return jsonify({
-        'homeworks': [h.to_dict(user_id=user_id_for_dict) for h in homeworks]
+        'homeworks': [h.to_dict(is_completed=is_completed) for h, is_completed in rows],
+        **(pager.meta() if pager else {})
     }), 200
 
 
@@ -94,7 +144,7 @@ def list_homeworks():
 @prof_or_admin_required
 def create_homework():
     """Créer un devoir (prof ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     data = request.get_json()
     
     # Validation
@@ -125,6 +175,7 @@ def create_homework():
     
     db.session.add(homework)
     db.session.commit()
+    response_cache.invalidate(_group_tag(homework.group_id))
     
     return jsonify({
         'message': 'Homework created successfully',
@@ -136,7 +187,7 @@ def create_homework():
 @jwt_required()
 def get_homework(homework_id):
     """Obtenir les détails d'un devoir"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     homework = Homework.query.get(homework_id)
     
     if not homework:
@@ -152,11 +203,11 @@ def get_homework(homework_id):
             return jsonify({'error': 'Access denied'}), 403
     else:
         # Élève peut voir les devoirs de ses groupes
-        if homework.group not in current_user.groups:
+        if not user_in_group(current_user, homework.group_id):
             return jsonify({'error': 'Access denied'}), 403
     
     return jsonify({
-        'homework': homework.to_dict(user_id=current_user.id)
+        'homework': homework.to_dict(is_completed=_is_completed(homework_id, current_user.id))
     }), 200
 
 
@@ -164,7 +215,7 @@ def get_homework(homework_id):
 @jwt_required()
 def update_homework(homework_id):
     """Modifier un devoir (propriétaire ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     homework = Homework.query.get(homework_id)
     
     if not homework:
@@ -195,6 +246,7 @@ def update_homework(homework_id):
         homework.subject = data['subject']
     
     db.session.commit()
+    response_cache.invalidate(_group_tag(homework.group_id))
     
     return jsonify({
         'message': 'Homework updated successfully',
@@ -206,38 +258,226 @@ def update_homework(homework_id):
 @jwt_required()
 def toggle_homework_completion(homework_id):
     """Marquer un devoir comme fait/non fait (élèves uniquement)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     homework = Homework.query.get(homework_id)
     
     if not homework:
         return jsonify({'error': 'Homework not found'}), 404
     
-    # Seuls les élèves peuvent marquer des devoirs comme complétés
-    if current_user.role != 'eleve':
-        return jsonify({'error': 'Only students can mark homeworks as completed'}), 403
+    denied = _check_completion_access(current_user, homework.group_id)
+    if denied:
+        return jsonify({'error': denied[0]}), denied[1]
     
-    # Vérifier que l'utilisateur est dans le groupe du devoir
-    if homework.group not in current_user.groups:
-        return jsonify({'error': 'You are not in this homework group'}), 403
-    
-    # Toggle completion
-    is_completed = any(u.id == current_user.id for u in homework.completed_by)
+    # Toggle completion (écriture regroupée avec celles des autres élèves)
+    is_completed = _is_completed(homework_id, current_user.id)
+    write_batcher.submit(_set_completion(homework_id, current_user.id, not is_completed))
     
     if is_completed:
-        # Retirer de la liste des complétés
-        homework.completed_by = [u for u in homework.completed_by if u.id != current_user.id]
         message = 'Homework marked as not completed'
     else:
-        # Ajouter à la liste des complétés
-        homework.completed_by.append(current_user)
         message = 'Homework marked as completed'
     
-    db.session.commit()
-    
     return jsonify({
         'message': message,
         'is_completed': not is_completed,
-        'homework': homework.to_dict(user_id=current_user.id)
+        'homework': homework.to_dict(is_completed=not is_completed)
+    }), 200
+
+
+@homeworks_bp.route('/<int:homework_id>/complete', methods=['PUT'])
+@jwt_required()
+def set_homework_completion(homework_id):
+    """Marquer un devoir comme fait ou non fait (idempotent, élèves uniquement)"""
+    current_user = get_current_principal()
+    data = request.get_json() or {}
+    
+    if not isinstance(data.get('completed'), bool):
+        return jsonify({'error': 'Missing required field: completed'}), 400
+    
+    homework = Homework.query.get(homework_id)
+    if not homework:
+        return jsonify({'error': 'Homework not found'}), 404
+    
+    denied = _check_completion_access(current_user, homework.group_id)
+    if denied:
+        return jsonify({'error': denied[0]}), denied[1]
+    
+    write_batcher.submit(_set_completion(homework_id, current_user.id, data['completed']))
+    
+    return jsonify({
+        'is_completed': data['completed'],
+        'homework': homework.to_dict(is_completed=data['completed'])
+    }), 200
+
+
+@homeworks_bp.route('/complete', methods=['POST'])
+@jwt_required()
+def set_homeworks_completion():
+    """Marquer plusieurs devoirs comme faits ou non faits en une transaction (élèves uniquement)"""
+    current_user = get_current_principal()
+    data = request.get_json() or {}
+    
+    homework_ids = data.get('homework_ids')
+    completed = data.get('completed', True)
+    if not isinstance(homework_ids, list) or not homework_ids:
+        return jsonify({'error': 'At least one homework must be selected'}), 400
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in homework_ids):
+        return jsonify({'error': 'homework_ids must be a list of integers'}), 400
+    if not isinstance(completed, bool):
+        return jsonify({'error': 'Invalid value for completed'}), 400
+    if current_user.role != 'eleve':
+        return jsonify({'error': 'Only students can mark homeworks as completed'}), 403
+    
+    # Groupe de chaque devoir demandé, en une requête
+    groups_by_id = dict(db.session.query(Homework.id, Homework.group_id)
+                        .filter(Homework.id.in_(homework_ids)).all())
+    
+    results = []
+    statements = []
+    for homework_id in dict.fromkeys(homework_ids):
+        if homework_id not in groups_by_id:
+            results.append({'homework_id': homework_id, 'error': 'Homework not found'})
+            continue
+        denied = _check_completion_access(current_user, groups_by_id[homework_id])
+        if denied:
+            results.append({'homework_id': homework_id, 'error': denied[0]})
+            continue
+        statements.append(_set_completion(homework_id, current_user.id, completed))
+        results.append({'homework_id': homework_id, 'is_completed': completed})
+    
+    if statements:
+        write_batcher.submit(*statements)
+    
+    return jsonify({
+        'updated': len(statements),
+        'results': results
+    }), 200
+
+
+@homeworks_bp.route('/workload', methods=['GET'])
+@jwt_required()
+@prof_or_admin_required
+def homework_workload():
+    """Nombre de devoirs à rendre par groupe, jour et matière (heatmap de charge)"""
+    try:
+        group_ids = sorted({int(g) for g in request.args.get('group_ids', '').split(',') if g.strip()})
+    except ValueError:
+        return jsonify({'error': 'Invalid group_ids'}), 400
+    if not group_ids:
+        return jsonify({'error': 'Missing required field: group_ids'}), 400
+    
+    start = validate_date(request.args['start']) if 'start' in request.args else datetime.utcnow()
+    if not start:
+        return jsonify({'error': 'Invalid date format'}), 400
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    end = validate_date(request.args['end']) if 'end' in request.args else start + timedelta(days=27)
+    if not end:
+        return jsonify({'error': 'Invalid date format'}), 400
+    end = end.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    if end < start or (end - start).days > 366:
+        return jsonify({'error': 'Invalid date range'}), 400
+    
+    def compute():
+        day = func.date(Homework.due_date)
+        rows = db.session.execute(
+            select(Homework.group_id, day, Homework.subject, func.count())
+            .where(Homework.group_id.in_(group_ids),
+                   Homework.due_date >= start,
+                   Homework.due_date < end + timedelta(days=1))
+            .group_by(Homework.group_id, day, Homework.subject)
+            .order_by(Homework.group_id, day, Homework.subject)
+        ).all()
+        
+        days_by_group = {group_id: {} for group_id in group_ids}
+        for group_id, due_day, subject, n in rows:
+            due_day = str(due_day)
+            entry = days_by_group[group_id].setdefault(due_day, {'date': due_day, 'total': 0, 'subjects': []})
+            entry['total'] += n
+            entry['subjects'].append({'subject': subject, 'count': n})
+        
+        return [{
+            'group_id': group_id,
+            'days': list(days.values()),
+            'max_per_day': max((d['total'] for d in days.values()), default=0)
+        } for group_id, days in days_by_group.items()]
+    
+    key = ('homework_workload', tuple(group_ids), start.date(), end.date())
+    groups = response_cache.get_or_set(key, compute, tags=[_group_tag(g) for g in group_ids])
+    
+    return jsonify({
+        'start': start.date().isoformat(),
+        'end': end.date().isoformat(),
+        'groups': groups
+    }), 200
+
+
+@homeworks_bp.route('/stats', methods=['GET'])
+@jwt_required()
+@prof_or_admin_required
+def homework_stats():
+    """Taux de complétion par devoir et par groupe (prof: ses devoirs, admin: tous)"""
+    current_user = get_current_principal()
+    group_id = request.args.get('group_id', type=int)
+    
+    # Nombre d'élèves par groupe
+    students = (select(user_groups.c.group_id, func.count().label('students'))
+                .join(User, User.id == user_groups.c.user_id)
+                .where(User.role == 'eleve')
+                .group_by(user_groups.c.group_id)
+                .subquery())
+    # Seules les complétions des élèves encore membres du groupe sont comptées
+    members = user_groups.alias('members')
+    completed = func.count(members.c.user_id)
+    
+    stmt = (select(Homework.id, Homework.title, Homework.subject, Homework.due_date, Homework.group_id,
+                   Group.name, func.coalesce(students.c.students, 0), completed)
+            .join(Group, Group.id == Homework.group_id)
+            .outerjoin(students, students.c.group_id == Homework.group_id)
+            .outerjoin(homework_completions, homework_completions.c.homework_id == Homework.id)
+            .outerjoin(members, and_(members.c.user_id == homework_completions.c.user_id,
+                                     members.c.group_id == Homework.group_id))
+            .group_by(Homework.id, Homework.title, Homework.subject, Homework.due_date, Homework.group_id,
+                      Group.name, students.c.students)
+            .order_by(Homework.group_id, Homework.due_date, Homework.id))
+    
+    if current_user.role == 'prof':
+        stmt = stmt.where(Homework.author_id == current_user.id)
+    if group_id:
+        stmt = stmt.where(Homework.group_id == group_id)
+    
+    def rate(done, total):
+        return round(done / total, 4) if total else None
+    
+    homeworks = []
+    groups = {}
+    for hw_id, title, subject, due_date, hw_group_id, group_name, group_size, done in db.session.execute(stmt):
+        homeworks.append({
+            'homework_id': hw_id,
+            'title': title,
+            'subject': subject,
+            'due_date': due_date.isoformat() if due_date else None,
+            'group_id': hw_group_id,
+            'group_name': group_name,
+            'students': group_size,
+            'completed': done,
+            'completion_rate': rate(done, group_size)
+        })
+        group = groups.setdefault(hw_group_id, {
+            'group_id': hw_group_id,
+            'group_name': group_name,
+            'students': group_size,
+            'homeworks': 0,
+            'completed': 0
+        })
+        group['homeworks'] += 1
+        group['completed'] += done
+    
+    for group in groups.values():
+        group['completion_rate'] = rate(group['completed'], group['students'] * group['homeworks'])
+    
+    return jsonify({
+        'homeworks': homeworks,
+        'groups': list(groups.values())
     }), 200
 
 
@@ -245,7 +485,7 @@ def toggle_homework_completion(homework_id):
 @jwt_required()
 def delete_homework(homework_id):
     """Supprimer un devoir (propriétaire ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     homework = Homework.query.get(homework_id)
     
     if not homework:
@@ -255,7 +495,11 @@ def delete_homework(homework_id):
     if current_user.role != 'admin' and homework.author_id != current_user.id:
         return jsonify({'error': 'Insufficient permissions'}), 403
     
+    group_id = homework.group_id
+    # Supprimer les complétions directement plutôt que de charger les élèves
+    db.session.execute(delete(homework_completions).where(homework_completions.c.homework_id == homework_id))
     db.session.delete(homework)
     db.session.commit()
+    response_cache.invalidate(_group_tag(group_id))
     
     return jsonify({'message': 'Homework deleted successfully'}), 200
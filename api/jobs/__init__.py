@@ -0,0 +1,4 @@
+"""Module jobs"""
+from .routes import jobs_bp
+
+__all__ = ['jobs_bp']
@@ -0,0 +1,45 @@
+"""Module de suivi des tâches de fond"""
+import os
+from flask import Blueprint, jsonify, send_file
+from flask_jwt_extended import jwt_required
+from core.permissions import get_current_principal, is_owner_or_admin
+from core.jobs import jobs
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/v1/jobs')
+
+
+def _get_job(job_id):
+    """Tâche visible par l'utilisateur courant (propriétaire ou admin)"""
+    job = jobs.get(job_id)
+    if not job or not is_owner_or_admin(get_current_principal(), job.owner_id):
+        return None
+    return job
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """État et progression d'une tâche"""
+    job = _get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@jobs_bp.route('/<job_id>/download', methods=['GET'])
+@jwt_required()
+def download_job_result(job_id):
+    """Télécharger le fichier produit par une tâche terminée"""
+    job = _get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.status != 'done':
+        return jsonify({'error': 'Job not finished', 'status': job.status}), 409
+    
+    if not job.result_path or not os.path.exists(job.result_path):
+        # Fichier écrit par un autre processus: REPORTS_FOLDER doit être partagé
+        return jsonify({'error': 'Result file not found on this server (is REPORTS_FOLDER shared?)'}), 404
+    
+    return send_file(job.result_path, as_attachment=True,
+                     download_name=os.path.basename(job.result_path))
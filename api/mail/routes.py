@@ -1,9 +1,14 @@
 """Module de gestion de la messagerie"""
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
 from core.extensions import db
 from core.models import Message, User
-from core.permissions import get_current_user, admin_required
+from core.permissions import get_current_principal, admin_required
+from core.read_models import inbox_summaries, sent_summaries
+from core.pagination import Keyset
+from core.write_batcher import write_batcher
 
 mail_bp = Blueprint('mail', __name__, url_prefix='/api/v1/mail')
 
@@ -12,14 +17,14 @@ mail_bp = Blueprint('mail', __name__, url_prefix='/api/v1/mail')
 @jwt_required()
 def get_inbox():
     """Récupérer les messages reçus"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
-    messages = Message.query.filter(Message.recipients.contains(current_user)).order_by(
-        Message.created_at.desc()
-    ).all()
+    pager = Keyset.from_request()
+    messages = inbox_summaries(current_user.id, pager)
     
     return jsonify({
-        'messages': [m.to_dict() for m in messages]
+        'messages': [m.to_dict() for m in messages],
+        **(pager.meta() if pager else {})
     }), 200
 
 
@@ -27,14 +32,14 @@ def get_inbox():
 @jwt_required()
 def get_sent():
     """Récupérer les messages envoyés"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
-    messages = Message.query.filter_by(sender_id=current_user.id).order_by(
-        Message.created_at.desc()
-    ).all()
+    pager = Keyset.from_request()
+    messages = sent_summaries(current_user.id, pager)
     
     return jsonify({
-        'messages': [m.to_dict() for m in messages]
+        'messages': [m.to_dict() for m in messages],
+        **(pager.meta() if pager else {})
     }), 200
 
 
@@ -42,7 +47,7 @@ def get_sent():
 @jwt_required()
 def send_message():
     """Envoyer un message"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     data = request.get_json()
     
     # Validation
@@ -81,20 +86,24 @@ def send_message():
 @jwt_required()
 def read_message(message_id):
     """Lire un message"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     message = Message.query.get(message_id)
     
     if not message:
         return jsonify({'error': 'Message not found'}), 404
     
+    is_recipient = any(r.id == current_user.id for r in message.recipients)
+    
     # Vérifier que l'utilisateur est destinataire ou expéditeur
-    if current_user not in message.recipients and message.sender_id != current_user.id:
+    if not is_recipient and message.sender_id != current_user.id:
         return jsonify({'error': 'Insufficient permissions'}), 403
     
     # Marquer comme lu si l'utilisateur est destinataire
-    if current_user in message.recipients and not message.is_read:
-        message.is_read = True
-        db.session.commit()
+    if is_recipient and not message.is_read:
+        write_batcher.submit(
+            update(Message).where(Message.id == message_id, Message.is_read.is_(False)).values(is_read=True)
+        )
+        set_committed_value(message, 'is_read', True)
     
     return jsonify(message.to_dict()), 200
 
@@ -103,7 +112,7 @@ def read_message(message_id):
 @jwt_required()
 def delete_message(message_id):
     """Supprimer un message (expéditeur ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     message = Message.query.get(message_id)
     
     if not message:
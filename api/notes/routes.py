@@ -1,66 +1,359 @@
 """Module de gestion des notes"""
+import uuid
+from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
+from sqlalchemy import and_, case, exists, func, insert, select
+from sqlalchemy.orm import aliased
 from core.extensions import db
-from core.models import Note, User
-from core.permissions import get_current_user, prof_or_admin_required
+from core.models import Note, User, Group, GradeAggregate, user_groups
+from core.membership import membership_index
+from core.permissions import get_current_principal, prof_or_admin_required, user_in_group, is_parent_of_child
+from core.utils import validate_date
+from core.read_models import list_student_summaries
+from core.streaming import stream_mode, stream_query, stream_csv
+from core.pagination import Keyset
+from core.cache import response_cache
+from core.grade_stats import stats_by_subject
+from core.grade_aggregates import record_inserted_notes, term_of, term_bounds
+from core.jobs import jobs
+from core.report_cards import FORMATS, generate_report_cards
 
 notes_bp = Blueprint('notes', __name__, url_prefix='/api/v1/notes')
 
+# Étiquette des statistiques qui portent sur toutes les matières
+ALL_SUBJECTS_TAG = 'notes:subjects'
+
+# Colonnes de l'export CSV des notes
+EXPORT_COLUMNS = ['id', 'student_id', 'student', 'teacher_id', 'teacher', 'subject', 'value',
+                  'max_value', 'assessment_id', 'comment', 'created_at']
+
+
+def _subject_tag(subject):
+    """Étiquette de cache des agrégats de notes d'une matière"""
+    return f'notes:subject:{subject}'
+
+
+def _invalidate_note_stats(*subjects):
+    """Invalide les agrégats mis en cache pour les matières modifiées"""
+    response_cache.invalidate(ALL_SUBJECTS_TAG, *[_subject_tag(s) for s in set(subjects)])
+
 
 @notes_bp.route('/students', methods=['GET'])
 @jwt_required()
 @prof_or_admin_required
 def list_students():
     """Lister les élèves (prof: ses élèves, admin: tous)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     if current_user.role == 'admin':
-        students = User.query.filter_by(role='eleve').all()
+        students = list_student_summaries()
     else:  # prof
         # Récupérer les élèves dans les groupes du prof
-        student_ids = set()
-        for group in current_user.groups:
-            for member in group.members:
-                if member.role == 'eleve':
-                    student_ids.add(member.id)
-        students = User.query.filter(User.id.in_(student_ids)).all() if student_ids else []
+        students = list_student_summaries(group_ids=list(membership_index.groups_of(current_user.id)))
+    
+    return jsonify({
+        'students': [s.to_dict() for s in students]
+    }), 200
+
+
+@notes_bp.route('/stats', methods=['GET'])
+@jwt_required()
+@prof_or_admin_required
+def note_stats():
+    """Statistiques de classe par matière: moyenne, médiane, écart-type, quantiles, histogramme"""
+    current_user = get_current_principal()
+    subject = request.args.get('subject')
+    group_id = request.args.get('group_id', type=int)
+    bins = request.args.get('bins', 10, type=int)
+    scale = request.args.get('scale', 20.0, type=float)
+    if not 1 <= bins <= 100 or scale <= 0:
+        return jsonify({'error': 'Invalid parameters'}), 400
+    
+    # Prof: statistiques des notes qu'il a données
+    teacher_id = current_user.id if current_user.role == 'prof' else None
+    
+    def compute():
+        stmt = select(Note.subject, Note.value, Note.max_value).where(Note.max_value > 0)
+        if teacher_id:
+            stmt = stmt.where(Note.teacher_id == teacher_id)
+        if subject:
+            stmt = stmt.where(Note.subject == subject)
+        if group_id:
+            stmt = stmt.where(Note.student_id.in_(
+                select(user_groups.c.user_id).where(user_groups.c.group_id == group_id)
+            ))
+        return stats_by_subject(db.session.execute(stmt).all(), bins=bins, scale=scale)
+    
+    key = ('note_stats', teacher_id, subject, group_id, bins, scale)
+    tags = [_subject_tag(subject)] if subject else [ALL_SUBJECTS_TAG]
+    subjects = response_cache.get_or_set(key, compute, tags=tags)
+    
+    return jsonify({
+        'group_id': group_id,
+        'scale': scale,
+        'subjects': subjects
+    }), 200
+
+
+@notes_bp.route('/gradebook', methods=['GET'])
+@jwt_required()
+@prof_or_admin_required
+def gradebook():
+    """Carnet de notes d'un groupe pour une matière: élèves x évaluations (prof: ses notes)"""
+    current_user = get_current_principal()
+    group_id = request.args.get('group_id', type=int)
+    subject = request.args.get('subject')
+    with_ids = bool(request.args.get('with_ids', type=int))
+    
+    if not group_id or not subject:
+        return jsonify({'error': 'Missing required fields'}), 400
+    if current_user.role == 'prof' and not user_in_group(current_user, group_id):
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    
+    note_filter = and_(Note.student_id == User.id, Note.subject == subject)
+    if current_user.role == 'prof':
+        note_filter = and_(note_filter, Note.teacher_id == current_user.id)
+    
+    # Élèves du groupe et leurs notes dans la matière, en une requête
+    rows = db.session.execute(
+        select(User.id, User.username, Note.id, Note.value, Note.max_value,
+               Note.assessment_id, Note.assessment_label, Note.teacher_id, Note.created_at)
+        .join(user_groups, user_groups.c.user_id == User.id)
+        .outerjoin(Note, note_filter)
+        .where(user_groups.c.group_id == group_id, User.role == 'eleve')
+        .order_by(User.username, User.id, Note.created_at, Note.id)
+    ).all()
+    
+    students = {}
+    assessments = {}
+    first_seen = {}
+    cells = {}
+    for student_id, username, note_id, value, max_value, assessment_id, label, teacher_id, created_at in rows:
+        students.setdefault(student_id, {'id': student_id, 'username': username})
+        if note_id is None:
+            continue
+        # Colonne: évaluation saisie en groupe, sinon jour, professeur et barème de la note
+        day = created_at.date().isoformat() if created_at else None
+        key = assessment_id or f'{day}|{teacher_id}|{max_value}'
+        # Plusieurs notes d'un élève pour la même colonne: une colonne chacune (#2, #3...)
+        ordinal = 1
+        while (student_id, key if ordinal == 1 else f'{key}#{ordinal}') in cells:
+            ordinal += 1
+        if ordinal > 1:
+            key = f'{key}#{ordinal}'
+        assessments.setdefault(key, {
+            'key': key,
+            'assessment_id': assessment_id,
+            'teacher_id': teacher_id,
+            'date': day,
+            'max_value': max_value,
+            'comment': None
+        })
+        # Intitulé porté par l'évaluation, jamais le commentaire personnel d'un élève
+        if label and not assessments[key]['comment']:
+            assessments[key]['comment'] = label
+        if created_at and (key not in first_seen or created_at < first_seen[key]):
+            first_seen[key] = created_at
+        cells[(student_id, key)] = (value, note_id)
+    
+    # Colonnes dans l'ordre chronologique des évaluations
+    columns = sorted(assessments.values(), key=lambda c: first_seen.get(c['key'], datetime.min))
+    
+    data = {
+        'group_id': group_id,
+        'subject': subject,
+        'students': list(students.values()),
+        'assessments': columns,
+        'values': [[cells.get((s, c['key']), (None, None))[0] for c in columns] for s in students]
+    }
+    if with_ids:
+        data['note_ids'] = [[cells.get((s, c['key']), (None, None))[1] for c in columns] for s in students]
+    
+    return jsonify(data), 200
+
+
+@notes_bp.route('/averages', methods=['GET'])
+@jwt_required()
+def note_averages():
+    """Moyennes et rangs d'un élève par matière pour un trimestre (lus dans les agrégats)"""
+    current_user = get_current_principal()
+    student_id = request.args.get('student_id', type=int)
+    term = request.args.get('term') or term_of()
+    
+    if current_user.role == 'eleve':
+        student_id = current_user.id
+    elif not student_id:
+        return jsonify({'error': 'Missing required field: student_id'}), 400
+    elif current_user.role == 'parent':
+        if not is_parent_of_child(current_user, student_id):
+            return jsonify({'error': 'Child not found or not associated with your account'}), 403
+    elif current_user.role == 'prof':
+        if not membership_index.shares_group(current_user.id, student_id):
+            return jsonify({'error': 'You can only view students in your groups'}), 403
+    
+    # Rang parmi les élèves qui partagent un groupe avec l'élève, en une requête
+    mine = aliased(GradeAggregate)
+    other = aliased(GradeAggregate)
+    peer_groups = select(user_groups.c.group_id).where(user_groups.c.user_id == student_id)
+    peers = select(user_groups.c.user_id).where(user_groups.c.group_id.in_(peer_groups.scalar_subquery()))
+    my_average = mine.sum_normalized / mine.weight_sum
+    other_average = other.sum_normalized / other.weight_sum
+    
+    rows = db.session.execute(
+        select(mine.subject, mine.sum_normalized, mine.weight_sum, mine.count,
+               func.count(other.id), func.sum(case((other_average > my_average, 1), else_=0)))
+        .outerjoin(other, and_(other.subject == mine.subject,
+                               other.term == mine.term,
+                               other.student_id.in_(peers.scalar_subquery())))
+        .where(mine.student_id == student_id, mine.term == term)
+        .group_by(mine.subject, mine.sum_normalized, mine.weight_sum, mine.count)
+        .order_by(mine.subject)
+    ).all()
+    
+    subjects = []
+    for subject, sum_normalized, weight_sum, n, cohort, better in rows:
+        subjects.append({
+            'subject': subject,
+            'average': round(20 * sum_normalized / weight_sum, 2) if weight_sum else None,
+            'count': n,
+            'rank': (better or 0) + 1,
+            'cohort_size': max(cohort, 1)
+        })
+    averages = [s['average'] for s in subjects if s['average'] is not None]
     
     return jsonify({
-        'students': [{'id': s.id, 'username': s.username, 'email': s.email, 'groups': [g.name for g in s.groups]} for s in students]
+        'student_id': student_id,
+        'term': term,
+        'subjects': subjects,
+        'general_average': round(sum(averages) / len(averages), 2) if averages else None
     }), 200
 
 
+def _export_row(row):
+    """Ligne CSV d'une note exportée"""
+    values = list(row)
+    values[-1] = row.created_at.isoformat() if row.created_at else ''
+    return values
+
+
+@notes_bp.route('/export', methods=['GET'])
+@jwt_required()
+@prof_or_admin_required
+def export_notes():
+    """Export CSV en flux des notes (admin: toutes, prof: ses notes); filtres start, end, group_id, subject"""
+    current_user = get_current_principal()
+    group_id = request.args.get('group_id', type=int)
+    subject = request.args.get('subject')
+    
+    bounds = {}
+    for name in ('start', 'end'):
+        if name in request.args:
+            parsed = validate_date(request.args[name])
+            if not parsed:
+                return jsonify({'error': 'Invalid date format'}), 400
+            bounds[name] = parsed.replace(tzinfo=None)
+    
+    student = aliased(User)
+    teacher = aliased(User)
+    stmt = (
+        select(Note.id, Note.student_id, student.username, Note.teacher_id, teacher.username,
+               Note.subject, Note.value, Note.max_value, Note.assessment_id, Note.comment, Note.created_at)
+        .join(student, student.id == Note.student_id)
+        .outerjoin(teacher, teacher.id == Note.teacher_id)
+        .order_by(Note.id)
+    )
+    if current_user.role == 'prof':
+        stmt = stmt.where(Note.teacher_id == current_user.id)
+    if 'start' in bounds:
+        stmt = stmt.where(Note.created_at >= bounds['start'])
+    if 'end' in bounds:
+        stmt = stmt.where(Note.created_at < bounds['end'])
+    if subject:
+        stmt = stmt.where(Note.subject == subject)
+    if group_id:
+        stmt = stmt.where(Note.student_id.in_(
+            select(user_groups.c.user_id).where(user_groups.c.group_id == group_id)
+        ))
+    
+    filename = f'notes_{datetime.utcnow():%Y%m%d_%H%M%S}.csv'
+    return stream_csv(stmt, EXPORT_COLUMNS, _export_row, filename)
+
+
+@notes_bp.route('/report-cards', methods=['POST'])
+@jwt_required()
+@prof_or_admin_required
+def create_report_cards():
+    """Lancer la génération des bulletins d'un groupe (tâche de fond, suivie via /api/v1/jobs)"""
+    current_user = get_current_principal()
+    data = request.get_json() or {}
+    group_id = data.get('group_id')
+    term = data.get('term') or term_of()
+    formats = data.get('formats') or list(FORMATS)
+    
+    if not group_id:
+        return jsonify({'error': 'Missing required field: group_id'}), 400
+    if not isinstance(group_id, int) or isinstance(group_id, bool):
+        return jsonify({'error': 'Invalid group_id'}), 400
+    if not isinstance(formats, list) or any(f not in FORMATS for f in formats):
+        return jsonify({'error': f'Invalid formats (allowed: {", ".join(FORMATS)})'}), 400
+    try:
+        term_bounds(term)
+    except ValueError:
+        return jsonify({'error': 'Invalid term'}), 400
+    
+    if not db.session.get(Group, group_id):
+        return jsonify({'error': 'Group not found'}), 404
+    if current_user.role == 'prof' and not user_in_group(current_user, group_id):
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    
+    job = jobs.submit('report_cards', current_user.id, generate_report_cards, group_id, term, formats)
+    return jsonify(job.to_dict()), 202
+
+
 @notes_bp.route('', methods=['GET'])
 @jwt_required()
 def list_notes():
     """Lister les notes (admin: toutes, prof: leurs notes, élève: leurs notes, parent: notes de leurs enfants)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     # Paramètre optionnel pour les parents: child_id
     child_id = request.args.get('child_id', type=int)
     
+    # Charger en amont les relations utilisées par to_dict
+    query = Note.query.options(*Note.eager_options())
+    
     if current_user.role == 'admin':
-        notes = Note.query.all()
+        pass
     elif current_user.role == 'prof':
-        notes = Note.query.filter_by(teacher_id=current_user.id).all()
+        query = query.filter_by(teacher_id=current_user.id)
     elif current_user.role == 'parent':
         # Parent voit les notes de ses enfants
         if child_id:
             # Vérifier que l'enfant appartient bien au parent
-            child = User.query.get(child_id)
-            if not child or child not in current_user.children:
+            if not is_parent_of_child(current_user, child_id):
                 return jsonify({'error': 'Child not found or not associated with your account'}), 403
-            notes = Note.query.filter_by(student_id=child_id).all()
+            query = query.filter_by(student_id=child_id)
         else:
             # Récupérer toutes les notes de tous les enfants
-            child_ids = [c.id for c in current_user.children]
-            notes = Note.query.filter(Note.student_id.in_(child_ids)).all() if child_ids else []
+            query = query.filter(Note.student_id.in_(membership_index.children_of(current_user.id)))
     else:  # eleve
-        notes = Note.query.filter_by(student_id=current_user.id).all()
+        query = query.filter_by(student_id=current_user.id)
+    
+    # Réponse en flux pour les grandes collections (NDJSON ou ?stream=1)
+    mode = stream_mode()
+    if mode:
+        return stream_query(query.order_by(Note.id), Note.to_dict, 'notes', mode)
+    
+    pager = Keyset.from_request()
+    if pager:
+        notes = pager.paginate(pager.apply(query, [Note.created_at, Note.id], descending=True).all())
+    else:
+        notes = query.all()
     
     return jsonify({
-        'notes': [n.to_dict() for n in notes]
+        'notes': [n.to_dict() for n in notes],
+        **(pager.meta() if pager else {})
     }), 200
 
 
@@ -69,7 +362,7 @@ def list_notes():
 @prof_or_admin_required
 def create_note():
     """Ajouter une note (prof ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     data = request.get_json()
     
     # Validation
@@ -87,8 +380,7 @@ def create_note():
     
     # Si prof, vérifier qu'ils partagent un groupe
     if current_user.role == 'prof':
-        shared_groups = set(current_user.groups) & set(student.groups)
-        if not shared_groups:
+        if not membership_index.shares_group(current_user.id, student.id):
             return jsonify({'error': 'You can only grade students in your groups'}), 403
     
     # Créer la note
@@ -98,11 +390,13 @@ def create_note():
         max_value=data.get('max_value', 20.0),
         comment=data.get('comment'),
         student_id=data['student_id'],
-        teacher_id=current_user.id
+        teacher_id=current_user.id,
+        assessment_id=data.get('assessment_id')
     )
     
     db.session.add(note)
     db.session.commit()
+    _invalidate_note_stats(note.subject)
     
     return jsonify({
         'message': 'Note created successfully',
@@ -110,11 +404,101 @@ def create_note():
     }), 201
 
 
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+@notes_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+@prof_or_admin_required
+def create_notes_bulk():
+    """Saisir les notes d'une évaluation pour toute une classe (prof ou admin)"""
+    current_user = get_current_principal()
+    data = request.get_json() or {}
+    
+    # Validation de l'évaluation
+    rows = data.get('notes')
+    if 'subject' not in data or not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'Missing required fields'}), 400
+    max_value = data.get('max_value', 20.0)
+    if not _is_number(max_value) or max_value <= 0:
+        return jsonify({'error': 'Invalid max_value'}), 400
+    assessment_id = data.get('assessment_id') or str(uuid.uuid4())
+    # Le commentaire commun sert d'intitulé à l'évaluation
+    label = data.get('comment')[:200] if isinstance(data.get('comment'), str) else None
+    
+    student_ids = {row['student_id'] for row in rows
+                   if isinstance(row, dict) and isinstance(row.get('student_id'), int)}
+    
+    # Rôle de chaque élève et, pour un prof, partage d'un groupe: une seule requête
+    stmt = select(User.id, User.role).where(User.id.in_(student_ids))
+    if current_user.role == 'prof':
+        teacher_groups = select(user_groups.c.group_id).where(user_groups.c.user_id == current_user.id)
+        stmt = stmt.add_columns(exists().where(
+            user_groups.c.user_id == User.id,
+            user_groups.c.group_id.in_(teacher_groups.scalar_subquery())
+        ))
+    students = {row[0]: row[1:] for row in db.session.execute(stmt)} if student_ids else {}
+    
+    values = []
+    errors = []
+    seen = set()
+    for index, row in enumerate(rows):
+        student_id = row.get('student_id') if isinstance(row, dict) else None
+        value = row.get('value') if isinstance(row, dict) else None
+        
+        error = None
+        if not isinstance(student_id, int) or value is None:
+            error = 'Missing required fields'
+        elif student_id in seen:
+            error = 'Duplicate student'
+        elif student_id not in students:
+            error = 'Student not found'
+        elif students[student_id][0] != 'eleve':
+            error = 'User is not a student'
+        elif current_user.role == 'prof' and not students[student_id][1]:
+            error = 'You can only grade students in your groups'
+        elif not _is_number(value) or not 0 <= value <= max_value:
+            error = 'Invalid value'
+        
+        if error:
+            errors.append({'index': index, 'student_id': student_id, 'error': error})
+            continue
+        
+        seen.add(student_id)
+        values.append({
+            'subject': data['subject'],
+            'value': value,
+            'max_value': max_value,
+            'comment': row.get('comment', data.get('comment')),
+            'student_id': student_id,
+            'teacher_id': current_user.id,
+            'assessment_id': assessment_id,
+            'assessment_label': label
+        })
+    
+    if not values:
+        return jsonify({'error': 'No valid notes', 'errors': errors}), 400
+    
+    # Insertion groupée (executemany) dans une seule transaction
+    db.session.execute(insert(Note), values)
+    record_inserted_notes(db.session.connection(), values)
+    db.session.commit()
+    _invalidate_note_stats(data['subject'])
+    
+    return jsonify({
+        'message': 'Notes created successfully',
+        'assessment_id': assessment_id,
+        'created': len(values),
+        'errors': errors
+    }), 201
+
+
 @notes_bp.route('/<int:note_id>', methods=['PUT'])
 @jwt_required()
 def update_note(note_id):
     """Modifier une note (propriétaire ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     note = Note.query.get(note_id)
     
     if not note:
@@ -125,6 +509,7 @@ def update_note(note_id):
         return jsonify({'error': 'Insufficient permissions'}), 403
     
     data = request.get_json()
+    old_subject = note.subject
     
     if 'subject' in data:
         note.subject = data['subject']
@@ -139,6 +524,7 @@ def update_note(note_id):
         note.comment = data['comment']
     
     db.session.commit()
+    _invalidate_note_stats(old_subject, note.subject)
     
     return jsonify({
         'message': 'Note updated successfully',
@@ -150,7 +536,7 @@ def update_note(note_id):
 @jwt_required()
 def delete_note(note_id):
     """Supprimer une note (propriétaire ou admin)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     note = Note.query.get(note_id)
     
     if not note:
@@ -160,7 +546,9 @@ def delete_note(note_id):
     if current_user.role != 'admin' and note.teacher_id != current_user.id:
         return jsonify({'error': 'Insufficient permissions'}), 403
     
+    subject = note.subject
     db.session.delete(note)
     db.session.commit()
+    _invalidate_note_stats(subject)
     
     return jsonify({'message': 'Note deleted successfully'}), 200
@@ -0,0 +1,4 @@
+"""Module parents"""
+from .routes import parents_bp
+
+__all__ = ['parents_bp']
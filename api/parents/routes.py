@@ -0,0 +1,192 @@
+"""Vues des comptes parents: devoirs, emploi du temps et notes de tous les enfants
+
+Chaque ressource est lue en une seule requête pour l'ensemble des enfants,
+par jointure sur ``parent_children`` (et ``user_groups`` pour les devoirs et
+les événements), puis regroupée par enfant.
+"""
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import and_, select
+from core.extensions import db
+from core.models import (User, Group, Homework, CalendarEvent, Note,
+                         user_groups, parent_children, homework_completions, event_groups)
+from core.permissions import get_current_principal, parent_required
+from core.utils import validate_date
+from core.recurrence import expand_events
+
+parents_bp = Blueprint('parents', __name__, url_prefix='/api/v1/parent')
+
+
+def _date_window():
+    """Bornes optionnelles ?start= et ?end= (None si absentes, ValueError si invalides)"""
+    bounds = []
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        if value is None:
+            bounds.append(None)
+            continue
+        parsed = validate_date(value)
+        if not parsed:
+            raise ValueError('Invalid date format')
+        bounds.append(parsed.replace(tzinfo=None))
+    return bounds
+
+
+def _children(parent_id):
+    """Enfants du parent avec leurs groupes (une requête)"""
+    rows = db.session.execute(
+        select(User.id, User.username, Group.id, Group.name)
+        .join(parent_children, parent_children.c.child_id == User.id)
+        .outerjoin(user_groups, user_groups.c.user_id == User.id)
+        .outerjoin(Group, Group.id == user_groups.c.group_id)
+        .where(parent_children.c.parent_id == parent_id)
+        .order_by(User.username, User.id, Group.name)
+    ).all()
+    
+    children = {}
+    for child_id, username, group_id, group_name in rows:
+        child = children.setdefault(child_id, {'id': child_id, 'username': username, 'groups': []})
+        if group_id is not None:
+            child['groups'].append({'id': group_id, 'name': group_name})
+    return children
+
+
+def _homeworks_by_child(parent_id, start=None, end=None):
+    """Devoirs des groupes de chaque enfant, avec la complétion de l'enfant"""
+    stmt = (select(parent_children.c.child_id, Homework, homework_completions.c.user_id.isnot(None))
+            .join(user_groups, user_groups.c.user_id == parent_children.c.child_id)
+            .join(Homework, Homework.group_id == user_groups.c.group_id)
+            .outerjoin(homework_completions, and_(
+                homework_completions.c.homework_id == Homework.id,
+                homework_completions.c.user_id == parent_children.c.child_id
+            ))
+            .where(parent_children.c.parent_id == parent_id)
+            .options(*Homework.eager_options())
+            .order_by(parent_children.c.child_id, Homework.due_date, Homework.id))
+    if start:
+        stmt = stmt.where(Homework.due_date >= start)
+    if end:
+        stmt = stmt.where(Homework.due_date <= end)
+    
+    result = {}
+    for child_id, homework, is_completed in db.session.execute(stmt):
+        result.setdefault(child_id, []).append(homework.to_dict(is_completed=is_completed))
+    return result
+
+
+def _events_by_child(parent_id, start=None, end=None):
+    """Événements des groupes de chaque enfant (séries développées sur la fenêtre)"""
+    stmt = (select(parent_children.c.child_id, CalendarEvent).distinct()
+            .join(user_groups, user_groups.c.user_id == parent_children.c.child_id)
+            .join(event_groups, event_groups.c.group_id == user_groups.c.group_id)
+            .join(CalendarEvent, CalendarEvent.id == event_groups.c.event_id)
+            .where(parent_children.c.parent_id == parent_id,
+                   # Événements qui chevauchent la fenêtre demandée
+                   *CalendarEvent.window_filter(start, end))
+            .options(*CalendarEvent.eager_options())
+            .order_by(parent_children.c.child_id, CalendarEvent.start_time, CalendarEvent.id))
+    
+    events = {}
+    for child_id, event in db.session.execute(stmt):
+        events.setdefault(child_id, []).append(event)
+    return {child_id: expand_events(rows, start, end) for child_id, rows in events.items()}
+
+
+def _notes_by_child(parent_id):
+    """Notes de chaque enfant, des plus récentes aux plus anciennes"""
+    stmt = (select(Note)
+            .join(parent_children, parent_children.c.child_id == Note.student_id)
+            .where(parent_children.c.parent_id == parent_id)
+            .options(*Note.eager_options())
+            .order_by(Note.student_id, Note.created_at.desc(), Note.id.desc()))
+    
+    result = {}
+    for note in db.session.execute(stmt).scalars():
+        result.setdefault(note.student_id, []).append(note.to_dict())
+    return result
+
+
+def _grouped(children, **resources):
+    """Assemble les ressources par enfant"""
+    return [
+        {**child, **{name: by_child.get(child_id, []) for name, by_child in resources.items()}}
+        for child_id, child in children.items()
+    ]
+
+
+@parents_bp.route('/children', methods=['GET'])
+@jwt_required()
+@parent_required
+def list_children():
+    """Lister les enfants du parent avec leurs groupes"""
+    current_user = get_current_principal()
+    
+    return jsonify({
+        'children': list(_children(current_user.id).values())
+    }), 200
+
+
+@parents_bp.route('/homeworks', methods=['GET'])
+@jwt_required()
+@parent_required
+def list_children_homeworks():
+    """Devoirs de tous les enfants, regroupés par enfant"""
+    current_user = get_current_principal()
+    try:
+        start, end = _date_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'children': _grouped(_children(current_user.id),
+                             homeworks=_homeworks_by_child(current_user.id, start, end))
+    }), 200
+
+
+@parents_bp.route('/events', methods=['GET'])
+@jwt_required()
+@parent_required
+def list_children_events():
+    """Emplois du temps de tous les enfants, regroupés par enfant"""
+    current_user = get_current_principal()
+    try:
+        start, end = _date_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'children': _grouped(_children(current_user.id),
+                             events=_events_by_child(current_user.id, start, end))
+    }), 200
+
+
+@parents_bp.route('/notes', methods=['GET'])
+@jwt_required()
+@parent_required
+def list_children_notes():
+    """Notes de tous les enfants, regroupées par enfant"""
+    current_user = get_current_principal()
+    
+    return jsonify({
+        'children': _grouped(_children(current_user.id),
+                             notes=_notes_by_child(current_user.id))
+    }), 200
+
+
+@parents_bp.route('/overview', methods=['GET'])
+@jwt_required()
+@parent_required
+def children_overview():
+    """Devoirs, événements et notes de tous les enfants en un seul appel"""
+    current_user = get_current_principal()
+    try:
+        start, end = _date_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'children': _grouped(_children(current_user.id),
+                             homeworks=_homeworks_by_child(current_user.id, start, end),
+                             events=_events_by_child(current_user.id, start, end),
+                             notes=_notes_by_child(current_user.id))
+    }), 200
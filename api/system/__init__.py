@@ -0,0 +1,4 @@
+"""Module system"""
+from .routes import system_bp
+
+__all__ = ['system_bp']
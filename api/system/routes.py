@@ -0,0 +1,19 @@
+"""Module d'administration technique (métriques)"""
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from core.permissions import admin_required
+from core.write_batcher import write_batcher
+from core.cache import response_cache
+
+system_bp = Blueprint('system', __name__, url_prefix='/api/v1/system')
+
+
+@system_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_metrics():
+    """Métriques internes du processus (admin uniquement)"""
+    return jsonify({
+        'write_batcher': write_batcher.metrics(),
+        'response_cache': response_cache.stats()
+    }), 200
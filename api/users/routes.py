@@ -3,7 +3,10 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from core.extensions import db, bcrypt
 from core.models import User, Group
-from core.permissions import get_current_user, admin_required, is_owner_or_admin
+from core.permissions import get_current_principal, admin_required, is_owner_or_admin, bump_claims_version
+from core.read_models import list_user_summaries, list_student_summaries
+from core.pagination import Keyset
+from core.blocklist import token_blocklist
 
 users_bp = Blueprint('users', __name__, url_prefix='/api/v1/users')
 
@@ -12,10 +15,10 @@ users_bp = Blueprint('users', __name__, url_prefix='/api/v1/users')
 @jwt_required()
 def list_users_for_messaging():
     """Lister tous les utilisateurs pour la messagerie (accessible à tous)"""
-    users = User.query.all()
+    users = list_user_summaries()
     
     return jsonify({
-        'users': [{'id': u.id, 'username': u.username, 'email': u.email, 'role': u.role} for u in users]
+        'users': [u.to_dict() for u in users]
     }), 200
 
 
@@ -23,11 +26,21 @@ def list_users_for_messaging():
 @jwt_required()
 @admin_required
 def list_users():
-    """Lister tous les utilisateurs (admin uniquement)"""
+    """Lister tous les utilisateurs (admin uniquement, par curseur avec ?limit=/?cursor=, sinon par page)"""
+    query = User.query.options(*User.eager_options())
+    
+    pager = Keyset.from_request()
+    if pager:
+        users = pager.paginate(pager.apply(query, [User.id]).all())
+        return jsonify({
+            'users': [u.to_dict() for u in users],
+            **pager.meta()
+        }), 200
+    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    users = User.query.paginate(page=page, per_page=per_page, error_out=False)
+    users = query.paginate(page=page, per_page=per_page, error_out=False)
     
     return jsonify({
         'users': [u.to_dict() for u in users.items],
@@ -82,7 +95,7 @@ def create_user():
 @jwt_required()
 def get_user(user_id):
     """Obtenir les détails d'un utilisateur (admin ou soi-même)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     if not is_owner_or_admin(current_user, user_id):
         return jsonify({'error': 'Insufficient permissions'}), 403
@@ -98,7 +111,7 @@ def get_user(user_id):
 @jwt_required()
 def update_user(user_id):
     """Modifier un utilisateur (admin ou soi-même)"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     if not is_owner_or_admin(current_user, user_id):
         return jsonify({'error': 'Insufficient permissions'}), 403
@@ -128,11 +141,16 @@ def update_user(user_id):
     
     if 'password' in data:
         user.password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        token_blocklist.revoke_user(user.id)
     
     if 'role' in data and current_user.role == 'admin':
         if data['role'] not in ['eleve', 'prof', 'admin', 'parent']:
             return jsonify({'error': 'Invalid role'}), 400
-        user.role = data['role']
+        if data['role'] != user.role:
+            user.role = data['role']
+            bump_claims_version(user.id)
+            # Les tokens émis avec l'ancien rôle ne doivent plus être acceptés
+            token_blocklist.revoke_user(user.id)
     
     db.session.commit()
     
@@ -151,6 +169,7 @@ def delete_user(user_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
+    bump_claims_version(user.id)
     db.session.delete(user)
     db.session.commit()
     
@@ -180,6 +199,7 @@ def manage_user_groups(user_id):
             if group and group in user.groups:
                 user.groups.remove(group)
     
+    bump_claims_version(user.id)
     db.session.commit()
     
     return jsonify({
@@ -192,7 +212,7 @@ def manage_user_groups(user_id):
 @jwt_required()
 def get_parent_children(parent_id):
     """Obtenir la liste des enfants d'un parent"""
-    current_user = get_current_user()
+    current_user = get_current_principal()
     
     # Vérifier que c'est le parent lui-même ou un admin
     if not is_owner_or_admin(current_user, parent_id):
@@ -205,8 +225,10 @@ def get_parent_children(parent_id):
     if parent.role != 'parent':
         return jsonify({'error': 'User is not a parent'}), 400
     
+    children = User.query.with_parent(parent, User.children).options(*User.eager_options()).all()
+    
     return jsonify({
-        'children': [{'id': c.id, 'username': c.username, 'email': c.email, 'groups': [g.name for g in c.groups]} for c in parent.children]
+        'children': [{'id': c.id, 'username': c.username, 'email': c.email, 'groups': [g.name for g in c.groups]} for c in children]
     }), 200
 
 
@@ -240,6 +262,7 @@ def manage_parent_children(parent_id):
             if child and child in parent.children:
                 parent.children.remove(child)
     
+    bump_claims_version(parent.id)
     db.session.commit()
     
     return jsonify({
@@ -253,8 +276,8 @@ def manage_parent_children(parent_id):
 @admin_required
 def list_students():
     """Lister tous les élèves (admin uniquement, pour l'association parent-enfant)"""
-    students = User.query.filter_by(role='eleve').all()
+    students = list_student_summaries()
     
     return jsonify({
-        'students': [{'id': s.id, 'username': s.username, 'email': s.email, 'groups': [g.name for g in s.groups]} for s in students]
+        'students': [s.to_dict() for s in students]
     }), 200
@@ -2,7 +2,7 @@
 import os
 from flask import Flask, send_from_directory, render_template
 from config import config
-from core.extensions import db, bcrypt, jwt, cors
+from core.extensions import db, bcrypt, jwt, cors, init_sqlite_profile
 
 
 def create_app(config_name='default'):
@@ -16,6 +16,12 @@ def create_app(config_name='default'):
     jwt.init_app(app)
     cors.init_app(app)
     
+    # Profil moteur SQLite (WAL, busy_timeout...) selon la configuration
+    sqlite_profile = init_sqlite_profile(app)
+    if sqlite_profile:
+        settings = ', '.join(f'{k}={v}' for k, v in sqlite_profile.items())
+        print(f"✓ SQLite engine profile: {settings}")
+    
     # Enregistrement des blueprints API
     from api.auth import auth_bp
     from api.users import users_bp
@@ -26,6 +32,9 @@ def create_app(config_name='default'):
     from api.calendar import calendar_bp
     from api.notes import notes_bp
     from api.attachments import attachments_bp
+    from api.parents import parents_bp
+    from api.system import system_bp
+    from api.jobs import jobs_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
@@ -36,6 +45,13 @@ def create_app(config_name='default'):
     app.register_blueprint(calendar_bp)
     app.register_blueprint(notes_bp)
     app.register_blueprint(attachments_bp)
+    app.register_blueprint(parents_bp)
+    app.register_blueprint(system_bp)
+    app.register_blueprint(jobs_bp)
+    
+    # Signaler au client les tokens dont les claims sont périmés
+    from core.permissions import add_claims_headers
+    app.after_request(add_claims_headers)
     
     # Routes pour le frontend
     @app.route('/')
@@ -84,9 +100,14 @@ def create_app(config_name='default'):
         """Servir les fichiers CSS/JS"""
         return send_from_directory('frontend/assets', path)
     
-    # Création des tables de la base de données
+    # Commandes CLI (migrations, maintenance)
+    from core.commands import register_commands
+    register_commands(app)
+    
+    # Création des tables et application des migrations de schéma
     with app.app_context():
-        db.create_all()
+        from core.migrations import run_migrations
+        run_migrations()
         
         # Créer un utilisateur admin par défaut si la base est vide
         from core.models import User
@@ -101,6 +122,14 @@ def create_app(config_name='default'):
             db.session.commit()
             print("✓ Admin user created (username: admin, password: admin123)")
     
+    # Liste de blocage des tokens révoqués (chargée après les migrations)
+    from core.blocklist import token_blocklist
+    token_blocklist.init_app(app)
+    
+    # Synchronisation périodique des abonnements .ics (si CALENDAR_SYNC_ENABLED)
+    from core.subscriptions import subscription_scheduler
+    subscription_scheduler.init_app(app)
+    
     return app
 
 
@@ -19,11 +19,57 @@ class Config:
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     JWT_COOKIE_CSRF_PROTECT = False
     JWT_CSRF_CHECK_FORM = False
+    # Durée (s) pendant laquelle la version des claims d'un utilisateur est mise en cache
+    CLAIMS_VERSION_TTL = int(os.environ.get('CLAIMS_VERSION_TTL', 30))
+    # Durée (s) avant reconstruction complète de l'index des appartenances
+    MEMBERSHIP_INDEX_TTL = int(os.environ.get('MEMBERSHIP_INDEX_TTL', 60))
+    # Liste de blocage: délai de prise en compte des révocations des autres processus,
+    # purge des révocations expirées et dimensionnement du filtre de Bloom
+    BLOCKLIST_SYNC_SECONDS = int(os.environ.get('BLOCKLIST_SYNC_SECONDS', 5))
+    BLOCKLIST_PRUNE_SECONDS = int(os.environ.get('BLOCKLIST_PRUNE_SECONDS', 3600))
+    BLOCKLIST_BLOOM_CAPACITY = 100000
+    BLOCKLIST_BLOOM_ERROR_RATE = 0.01
+    
+    # Regroupement des petites écritures (devoirs faits, messages lus) en une
+    # transaction par fenêtre de WRITE_BATCH_WINDOW_MS millisecondes
+    WRITE_BATCHING_ENABLED = os.environ.get('WRITE_BATCHING_ENABLED', 'false').lower() == 'true'
+    WRITE_BATCH_WINDOW_MS = int(os.environ.get('WRITE_BATCH_WINDOW_MS', 5))
+    WRITE_BATCH_MAX_SIZE = 500
+    WRITE_BATCH_TIMEOUT = int(os.environ.get('WRITE_BATCH_TIMEOUT', 10))
+    
+    # Cache des réponses agrégées (invalidé à chaque écriture concernée)
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    CACHE_MAX_ENTRIES = 1024
+    
+    # Tâches de fond (bulletins, imports): threads et conservation des résultats
+    JOBS_MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', 2))
+    JOBS_RETENTION_SECONDS = 24 * 3600
+    
+    # Bulletins: dossier des archives, processus de rendu (0: un par cœur)
+    REPORTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports')
+    REPORT_CARD_WORKERS = int(os.environ.get('REPORT_CARD_WORKERS', 0))
+    REPORT_CARD_CHUNK_SIZE = 20
+    
+    # Import .ics: taille des lots, et taille au-delà de laquelle l'import passe en tâche de fond
+    ICS_IMPORT_BATCH_SIZE = 500
+    ICS_IMPORT_ASYNC_BYTES = int(os.environ.get('ICS_IMPORT_ASYNC_BYTES', 1024 * 1024))
+    
+    # Abonnements .ics: planificateur (un seul processus), fréquence de vérification, délai réseau
+    CALENDAR_SYNC_ENABLED = os.environ.get('CALENDAR_SYNC_ENABLED', 'false').lower() == 'true'
+    CALENDAR_SYNC_POLL_SECONDS = int(os.environ.get('CALENDAR_SYNC_POLL_SECONDS', 60))
+    CALENDAR_SYNC_TIMEOUT = 30
     
     # Upload
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
+    # Réponses en flux: nombre de lignes lues et envoyées par lot
+    STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+    
+    # Pagination par curseur (?limit=&cursor=)
+    PAGINATION_DEFAULT_LIMIT = 50
+    PAGINATION_MAX_LIMIT = 200
+    
     # Frontend
     FRONTEND_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend')
 
@@ -38,6 +84,26 @@ class ProductionConfig(Config):
     """Configuration pour la production"""
     DEBUG = False
     TESTING = False
+    
+    # Profil SQLite appliqué à chaque nouvelle connexion (voir core.extensions)
+    # WAL: les lectures ne sont plus bloquées par les écritures
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),  # octets
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # négatif: en Kio
+        'foreign_keys': os.environ.get('SQLITE_FOREIGN_KEYS', 'ON'),
+    }
+    
+    # Pool de connexions
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+        'pool_pre_ping': True,
+    }
 
 
 class TestConfig(Config):
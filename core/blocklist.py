@@ -0,0 +1,175 @@
+"""Liste de blocage des tokens JWT révoqués
+
+Les révocations sont enregistrées dans la table ``revoked_tokens``. Chaque
+processus garde en mémoire un filtre de Bloom des clés révoquées (``jti``
+des tokens et ``user:<id>`` pour les révocations globales d'un utilisateur):
+un token absent du filtre est accepté sans requête SQL. Seuls les tokens
+signalés par le filtre (révoqués, ou faux positifs) sont vérifiés en base.
+
+Le filtre est chargé au démarrage puis complété par les nouvelles lignes de
+la table (révocations faites par les autres processus) au plus une fois
+toutes les ``BLOCKLIST_SYNC_SECONDS``. Les lignes expirées sont supprimées
+et le filtre reconstruit toutes les ``BLOCKLIST_PRUNE_SECONDS``.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from core.extensions import db, jwt
+from core.models import RevokedToken
+
+
+class BloomFilter:
+    """Filtre de Bloom: appartenance probabiliste sans faux négatif"""
+    __slots__ = ('size', 'hashes', 'bits', 'count')
+    
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, key):
+        """Positions des bits de la clé (double hachage)"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def add(self, key):
+        """Ajoute une clé au filtre"""
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+    
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+def _user_key(user_id):
+    """Clé du filtre pour une révocation globale d'un utilisateur"""
+    return f'user:{user_id}'
+
+
+def _utc(timestamp):
+    """Timestamp JWT -> datetime UTC naïf (convention des modèles)"""
+    return datetime.utcfromtimestamp(timestamp)
+
+
+class TokenBlocklist:
+    """Liste de blocage des tokens, avec pré-filtre en mémoire"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(1)
+        self._last_id = 0
+        self._next_sync = 0.0
+        self._next_prune = 0.0
+    
+    def init_app(self, app):
+        """Branche la vérification sur Flask-JWT-Extended et charge le filtre"""
+        jwt.token_in_blocklist_loader(self._token_in_blocklist)
+        with app.app_context():
+            self.rebuild()
+    
+    def rebuild(self):
+        """Supprime les révocations expirées et reconstruit le filtre"""
+        config = current_app.config
+        now = time.monotonic()
+        RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete()
+        db.session.commit()
+        
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti, RevokedToken.user_id,
+                                RevokedToken.revoked_before).all()
+        bloom = BloomFilter(max(config.get('BLOCKLIST_BLOOM_CAPACITY', 100000), 2 * len(rows)),
+                            config.get('BLOCKLIST_BLOOM_ERROR_RATE', 0.01))
+        for row in rows:
+            self._add_row(bloom, row)
+        
+        with self._lock:
+            self._bloom = bloom
+            self._last_id = max((row.id for row in rows), default=0)
+            self._next_sync = now + config.get('BLOCKLIST_SYNC_SECONDS', 5)
+            self._next_prune = now + config.get('BLOCKLIST_PRUNE_SECONDS', 3600)
+    
+    @staticmethod
+    def _add_row(bloom, row):
+        if row.jti:
+            bloom.add(row.jti)
+        if row.revoked_before:
+            bloom.add(_user_key(row.user_id))
+    
+    def sync(self):
+        """Ajoute au filtre les révocations enregistrées par les autres processus"""
+        now = time.monotonic()
+        if now < self._next_prune:
+            if now < self._next_sync:
+                return
+            with self._lock:
+                last_id = self._last_id
+                self._next_sync = now + current_app.config.get('BLOCKLIST_SYNC_SECONDS', 5)
+            rows = db.session.query(RevokedToken.id, RevokedToken.jti, RevokedToken.user_id,
+                                    RevokedToken.revoked_before).filter(RevokedToken.id > last_id).all()
+            with self._lock:
+                for row in rows:
+                    self._add_row(self._bloom, row)
+                    self._last_id = max(self._last_id, row.id)
+        else:
+            self.rebuild()
+    
+    def _token_in_blocklist(self, jwt_header, jwt_payload):
+        """Callback token_in_blocklist_loader de Flask-JWT-Extended"""
+        self.sync()
+        return self.is_revoked(jwt_payload)
+    
+    def is_revoked(self, jwt_payload):
+        """Le token est-il révoqué ? (requête SQL seulement si le filtre le signale)"""
+        jti = jwt_payload['jti']
+        user_id = int(jwt_payload['sub'])
+        
+        if jti in self._bloom and RevokedToken.query.filter_by(jti=jti).first():
+            return True
+        
+        if _user_key(user_id) in self._bloom:
+            issued_at = _utc(jwt_payload['iat'])
+            return RevokedToken.query.filter(
+                RevokedToken.user_id == user_id,
+                RevokedToken.revoked_before > issued_at
+            ).first() is not None
+        
+        return False
+    
+    def revoke_token(self, jwt_payload):
+        """Révoque un token précis jusqu'à son expiration (à committer par l'appelant)"""
+        jti = jwt_payload['jti']
+        if RevokedToken.query.filter_by(jti=jti).first():
+            return
+        db.session.add(RevokedToken(
+            jti=jti,
+            user_id=int(jwt_payload['sub']),
+            token_type=jwt_payload.get('type'),
+            expires_at=_utc(jwt_payload['exp'])
+        ))
+        with self._lock:
+            self._bloom.add(jti)
+    
+    def revoke_user(self, user_id):
+        """Révoque tous les tokens déjà émis pour l'utilisateur (à committer par l'appelant)"""
+        now = datetime.utcnow()
+        lifetime = max(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'],
+                       current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+        # iat est à la seconde près: seuls les tokens émis avant la seconde en
+        # cours sont révoqués, ce qui laisse valides ceux émis juste après
+        db.session.add(RevokedToken(
+            user_id=user_id,
+            revoked_before=now.replace(microsecond=0),
+            expires_at=now + lifetime
+        ))
+        with self._lock:
+            self._bloom.add(_user_key(user_id))
+
+
+token_blocklist = TokenBlocklist()
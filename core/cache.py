@@ -0,0 +1,102 @@
+"""Cache de réponses en mémoire, invalidé par étiquettes
+
+Chaque entrée est associée à des étiquettes (par exemple ``homeworks:group:3``).
+Les routes qui modifient les données invalident les étiquettes concernées
+après le commit, ce qui supprime toutes les entrées qui en dépendent. Les
+entrées expirent aussi après ``CACHE_DEFAULT_TTL`` secondes, ce qui borne le
+retard sur les écritures faites par les autres processus, et les moins
+récemment utilisées sont évincées au-delà de ``CACHE_MAX_ENTRIES``.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from flask import current_app
+
+
+class TaggedCache:
+    """Cache LRU avec expiration et invalidation par étiquettes"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> (valeur, expiration, étiquettes)
+        self._keys_by_tag = defaultdict(set)
+        self._hits = 0
+        self._misses = 0
+    
+    def get(self, key, default=None):
+        """Valeur en cache pour la clé (default si absente ou expirée)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+    
+    def set(self, key, value, tags=(), ttl=None):
+        """Met la valeur en cache sous les étiquettes données"""
+        config = current_app.config
+        if ttl is None:
+            ttl = config.get('CACHE_DEFAULT_TTL', 300)
+        max_entries = config.get('CACHE_MAX_ENTRIES', 1024)
+        
+        with self._lock:
+            self._discard(key)
+            tags = frozenset(tags)
+            self._entries[key] = (value, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+            while len(self._entries) > max_entries:
+                self._discard(next(iter(self._entries)))
+    
+    def get_or_set(self, key, compute, tags=(), ttl=None):
+        """Valeur en cache, ou calculée par compute() puis mise en cache"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, tags, ttl)
+        return value
+    
+    def invalidate(self, *tags):
+        """Supprime toutes les entrées associées à l'une des étiquettes"""
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._discard(key)
+    
+    def clear(self):
+        """Vide le cache"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+    
+    def _discard(self, key):
+        """Retire une entrée et ses références d'étiquettes (appelée sous verrou)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+    
+    def stats(self):
+        """Taille du cache et taux de succès"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'tags': len(self._keys_by_tag),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None
+            }
+
+
+response_cache = TaggedCache()
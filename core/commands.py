@@ -0,0 +1,40 @@
+"""Commandes CLI Flask pour OpenDirecte"""
+import click
+from core.migrations import run_migrations, applied_versions, MIGRATIONS
+from core.extensions import db
+from core.grade_aggregates import rebuild as rebuild_grade_aggregates
+
+
+@click.command('upgrade-db')
+def upgrade_db_command():
+    """Appliquer les migrations de schéma en attente"""
+    applied = run_migrations()
+    for version, name in applied:
+        click.echo(f'✓ {version:04d}_{name}')
+    if not applied:
+        click.echo('Database schema is up to date')
+
+
+@click.command('db-status')
+def db_status_command():
+    """Afficher l'état des migrations de schéma"""
+    with db.engine.connect() as connection:
+        done = applied_versions(connection)
+    for version, name, _ in MIGRATIONS:
+        state = 'applied' if version in done else 'pending'
+        click.echo(f'{version:04d}_{name}: {state}')
+
+
+@click.command('rebuild-grade-aggregates')
+def rebuild_grade_aggregates_command():
+    """Recalculer les moyennes par élève, matière et trimestre"""
+    with db.engine.begin() as connection:
+        count = rebuild_grade_aggregates(connection)
+    click.echo(f'✓ {count} grade aggregates rebuilt')
+
+
+def register_commands(app):
+    """Enregistre les commandes CLI sur l'application"""
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(db_status_command)
+    app.cli.add_command(rebuild_grade_aggregates_command)
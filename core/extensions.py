@@ -1,4 +1,5 @@
 """Extensions Flask pour OpenDirecte"""
+from sqlalchemy import event
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
@@ -9,3 +10,31 @@ db = SQLAlchemy()
 bcrypt = Bcrypt()
 jwt = JWTManager()
 cors = CORS()
+
+
+def init_sqlite_profile(app):
+    """Applique les PRAGMA SQLITE_PRAGMAS à chaque connexion et retourne les valeurs effectives"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return None
+    
+    with app.app_context():
+        engine = db.engine
+    
+    if engine.dialect.name != 'sqlite':
+        return None
+    
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    
+    # Relire les valeurs effectivement retenues par SQLite
+    effective = {}
+    with engine.connect() as connection:
+        for name in pragmas:
+            effective[name] = connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+    effective['pool'] = engine.pool.status()
+    return effective
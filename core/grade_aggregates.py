@@ -0,0 +1,156 @@
+"""Agrégats de notes par élève, matière et trimestre
+
+La table ``grade_aggregates`` contient, pour chaque élève, matière et
+trimestre, la somme des notes normalisées (``value / max_value``), la somme
+des poids et le nombre de notes. Elle est tenue à jour de façon incrémentale:
+chaque flush qui crée, modifie ou supprime des ``Note`` (y compris par
+cascade) applique les variations correspondantes dans la même transaction.
+Les insertions groupées, qui contournent l'unité de travail de l'ORM,
+appellent ``record_inserted_notes``.
+
+Lire les moyennes d'un élève ne coûte ainsi qu'une ligne par matière, quel
+que soit le nombre de notes. ``flask rebuild-grade-aggregates`` recalcule la
+table à partir des notes.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import and_, delete, event, inspect, insert, select, update
+from sqlalchemy.orm import Session
+from core.models import Note, GradeAggregate
+
+# Colonnes de Note dont dépendent les agrégats
+FIELDS = ('student_id', 'subject', 'created_at', 'value', 'max_value')
+
+# Trimestre au format de term_of: AAAA-AAAA-T1..T3 (années consécutives)
+TERM_PATTERN = re.compile(r'(\d{4})-(\d{4})-T([123])')
+
+
+def term_of(date=None):
+    """Trimestre scolaire d'une date (T1: sept.-déc., T2: janv.-mars, T3: avr.-août)"""
+    date = date or datetime.utcnow()
+    start_year = date.year if date.month >= 9 else date.year - 1
+    if date.month >= 9:
+        term = 1
+    elif date.month <= 3:
+        term = 2
+    else:
+        term = 3
+    return f'{start_year}-{start_year + 1}-T{term}'
+
+
+def term_bounds(term):
+    """Période [début, fin) d'un trimestre au format de term_of (ValueError si invalide)"""
+    match = TERM_PATTERN.fullmatch(term) if isinstance(term, str) else None
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        raise ValueError('Invalid term')
+    start_year, number = int(match.group(1)), int(match.group(3))
+    if number == 1:
+        return datetime(start_year, 9, 1), datetime(start_year + 1, 1, 1)
+    if number == 2:
+        return datetime(start_year + 1, 1, 1), datetime(start_year + 1, 4, 1)
+    return datetime(start_year + 1, 4, 1), datetime(start_year + 1, 9, 1)
+
+
+def _add(deltas, student_id, subject, created_at, value, max_value, sign):
+    """Ajoute (ou retire, sign=-1) la contribution d'une note aux variations"""
+    if not max_value or value is None:
+        return
+    delta = deltas[(student_id, subject, term_of(created_at))]
+    delta[0] += sign * value / max_value
+    delta[1] += sign * 1.0  # poids unitaire: pas de coefficient par note
+    delta[2] += sign
+
+
+def apply_deltas(connection, deltas):
+    """Applique des variations {(élève, matière, trimestre): [somme, poids, nombre]}"""
+    table = GradeAggregate.__table__
+    now = datetime.utcnow()
+    for (student_id, subject, term), (d_sum, d_weight, d_count) in deltas.items():
+        if not d_count and not d_sum and not d_weight:
+            continue
+        key = and_(table.c.student_id == student_id, table.c.subject == subject, table.c.term == term)
+        result = connection.execute(update(table).where(key).values(
+            sum_normalized=table.c.sum_normalized + d_sum,
+            weight_sum=table.c.weight_sum + d_weight,
+            count=table.c.count + d_count,
+            updated_at=now
+        ))
+        if result.rowcount == 0 and d_count > 0:
+            connection.execute(insert(table).values(
+                student_id=student_id, subject=subject, term=term,
+                sum_normalized=d_sum, weight_sum=d_weight, count=d_count, updated_at=now
+            ))
+        elif d_count < 0:
+            connection.execute(delete(table).where(key, table.c.count <= 0))
+
+
+def record_inserted_notes(connection, rows):
+    """Met à jour les agrégats après une insertion groupée de notes (dictionnaires)"""
+    deltas = defaultdict(lambda: [0.0, 0.0, 0])
+    for row in rows:
+        _add(deltas, row['student_id'], row['subject'], row.get('created_at'),
+             row['value'], row.get('max_value', 20.0), 1)
+    apply_deltas(connection, deltas)
+
+
+def _previous(state, key):
+    """Valeur d'un attribut avant les modifications du flush
+    
+    Les colonnes de FIELDS sont en active_history (core/models.py): une valeur
+    modifiée a toujours son ancienne valeur dans ``history.deleted``, y compris
+    sur une instance expirée. Un attribut non modifié vaut sa valeur en base.
+    """
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[key].value
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_note_changes(session, flush_context):
+    """Répercute sur les agrégats les notes créées, modifiées et supprimées"""
+    deltas = defaultdict(lambda: [0.0, 0.0, 0])
+    
+    for obj in session.new:
+        if isinstance(obj, Note):
+            _add(deltas, *[getattr(obj, f) for f in FIELDS], 1)
+    
+    for obj in session.deleted:
+        if isinstance(obj, Note):
+            state = inspect(obj)
+            _add(deltas, *[_previous(state, f) for f in FIELDS], -1)
+    
+    for obj in session.dirty:
+        if isinstance(obj, Note) and session.is_modified(obj):
+            state = inspect(obj)
+            _add(deltas, *[_previous(state, f) for f in FIELDS], -1)
+            _add(deltas, *[getattr(obj, f) for f in FIELDS], 1)
+    
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def rebuild(connection):
+    """Recalcule toute la table à partir des notes; renvoie le nombre de lignes"""
+    notes = Note.__table__
+    table = GradeAggregate.__table__
+    deltas = defaultdict(lambda: [0.0, 0.0, 0])
+    
+    result = connection.execution_options(stream_results=True, yield_per=1000).execute(
+        select(notes.c.student_id, notes.c.subject, notes.c.created_at, notes.c.value, notes.c.max_value)
+    )
+    for row in result:
+        _add(deltas, *row, 1)
+    
+    now = datetime.utcnow()
+    connection.execute(delete(table))
+    rows = [{
+        'student_id': student_id, 'subject': subject, 'term': term,
+        'sum_normalized': d_sum, 'weight_sum': d_weight, 'count': d_count, 'updated_at': now
+    } for (student_id, subject, term), (d_sum, d_weight, d_count) in deltas.items()]
+    if rows:
+        connection.execute(insert(table), rows)
+    return len(rows)
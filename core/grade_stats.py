@@ -0,0 +1,44 @@
+"""Statistiques de classe sur les notes, calculées avec NumPy
+
+Les notes sont lues en colonnes (matière, valeur, barème) par une seule
+requête puis normalisées (``value / max_value``) et ramenées à l'échelle
+demandée (sur 20 par défaut). Les statistiques de chaque matière sont
+calculées sur des tableaux NumPy, sans créer d'objet Python par note.
+"""
+import numpy as np
+
+QUANTILES = (0.1, 0.25, 0.75, 0.9)
+
+
+def describe(scores, bins, scale):
+    """Statistiques descriptives et histogramme d'un tableau de notes"""
+    # Valeurs hors barème comptées dans les classes extrêmes de l'histogramme
+    counts, edges = np.histogram(np.clip(scores, 0, scale), bins=bins, range=(0, scale))
+    quantiles = np.quantile(scores, QUANTILES)
+    return {
+        'count': int(scores.size),
+        'mean': round(float(scores.mean()), 2),
+        'median': round(float(np.median(scores)), 2),
+        'std': round(float(scores.std()), 2),
+        'min': round(float(scores.min()), 2),
+        'max': round(float(scores.max()), 2),
+        'quantiles': {f'q{int(q * 100)}': round(float(v), 2) for q, v in zip(QUANTILES, quantiles)},
+        'histogram': {
+            'edges': [round(float(e), 2) for e in edges],
+            'counts': counts.tolist()
+        }
+    }
+
+
+def stats_by_subject(rows, bins=10, scale=20.0):
+    """Statistiques par matière à partir de lignes (matière, valeur, barème)"""
+    if not rows:
+        return []
+    subjects, values, max_values = zip(*rows)
+    scores = np.asarray(values, dtype=float) / np.asarray(max_values, dtype=float) * scale
+    
+    names, inverse = np.unique(np.asarray(subjects, dtype=object), return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(scores[order], np.cumsum(np.bincount(inverse))[:-1])
+    
+    return [{'subject': name, **describe(group, bins, scale)} for name, group in zip(names, groups)]
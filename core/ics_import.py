@@ -0,0 +1,304 @@
+"""Import iCalendar (.ics) en flux avec mise à jour par UID
+
+Le fichier est lu ligne par ligne: chaque VEVENT est déplié et analysé
+séparément, sans construire le calendrier complet en mémoire. Les
+événements sont rapprochés des événements existants du groupe par leur UID
+(index unique ``(group_id, uid)``) et écrits par lots: une requête de
+lecture, un INSERT et un UPDATE groupés (executemany) par lot.
+
+Les séries (RRULE/EXDATE) et les occurrences modifiées (RECURRENCE-ID) sont
+traitées en fin de fichier, une fois toutes les occurrences modifiées
+connues: leurs débuts d'origine sont ajoutés aux dates exclues de la série.
+
+Les heures sont enregistrées telles qu'écrites dans le fichier (heure
+locale du fuseau TZID), comme les événements créés depuis l'interface.
+
+Pour un abonnement (``subscription_id``), le flux fait foi: les événements
+de l'abonnement absents du flux sont supprimés en fin d'import.
+"""
+from datetime import date, datetime, time, timedelta
+from icalendar import Event
+from sqlalchemy import bindparam, delete, insert, select, tuple_, update
+from core.extensions import db
+from core.models import CalendarEvent, event_groups
+from core.recurrence import normalize_rule, series_end, format_exdates, parse_exdates
+
+# Colonnes comparées pour décider si un événement a changé
+FIELDS = ('title', 'description', 'location', 'start_time', 'end_time', 'rrule', 'exdates', 'recurrence_id',
+          'subscription_id')
+
+
+def iter_vevents(stream):
+    """Parcourt les VEVENT d'un flux .ics (binaire): lignes dépliées de chaque bloc
+    
+    Lève ValueError si le flux n'est pas un calendrier. Les blocs ne sont pas
+    analysés ici: un VEVENT mal formé est écarté par l'appelant sans
+    interrompre la lecture du fichier.
+    """
+    block = None
+    started = False
+    for raw in stream:
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not started:
+            if not line.strip():
+                continue
+            if line.lstrip('\ufeff') != 'BEGIN:VCALENDAR':
+                raise ValueError('Not an iCalendar stream')
+            started = True
+            continue
+        if block is not None and line[:1] in (' ', '\t'):
+            # Ligne repliée (RFC 5545 §3.1): suite de la précédente
+            block[-1] += line[1:]
+            continue
+        if line == 'BEGIN:VEVENT':
+            if block is not None:
+                yield block  # bloc non fermé: rejeté à l'analyse
+            block = [line]
+        elif block is not None:
+            block.append(line)
+            if line == 'END:VEVENT':
+                yield block
+                block = None
+    if block is not None:
+        yield block
+
+
+def _block_uid(block):
+    """UID d'un bloc VEVENT lu sans l'analyser (chaîne vide si absent)"""
+    for line in block:
+        name, _, value = line.partition(':')
+        if name.split(';', 1)[0].upper() == 'UID':
+            return value.strip()[:255]
+    return ''
+
+
+def _naive(value):
+    """Date ou date-heure iCalendar en datetime sans fuseau"""
+    if not isinstance(value, datetime) and isinstance(value, date):
+        return datetime.combine(value, time())
+    return value.replace(tzinfo=None)
+
+
+def event_values(component):
+    """Valeurs d'un VEVENT pour calendar_events (ValueError si inexploitable)"""
+    uid = str(component.get('uid', '')).strip()
+    if not uid or 'dtstart' not in component:
+        raise ValueError('Missing UID or DTSTART')
+    
+    dtstart = component.get('dtstart').dt
+    start_time = _naive(dtstart)
+    if 'dtend' in component:
+        end_time = _naive(component.get('dtend').dt)
+    elif 'duration' in component:
+        end_time = start_time + component.get('duration').dt
+    else:
+        # Sans fin: une journée pour un événement « journée entière »
+        end_time = start_time + (timedelta(days=1) if not isinstance(dtstart, datetime) else timedelta(0))
+    if end_time < start_time:
+        raise ValueError('DTEND before DTSTART')
+    
+    exdates = []
+    raw_exdates = component.get('exdate')
+    for item in raw_exdates if isinstance(raw_exdates, list) else [raw_exdates] if raw_exdates else []:
+        exdates.extend(_naive(d.dt) for d in item.dts)
+    
+    rule = None
+    if 'rrule' in component:
+        start_time = start_time.replace(microsecond=0)
+        rule = normalize_rule(component.get('rrule').to_ical().decode(), start_time)
+    
+    recurrence_id = component.get('recurrence-id')
+    return {
+        'uid': uid[:255],
+        'title': str(component.get('summary', 'Sans titre'))[:200],
+        'description': str(component.get('description', '')),
+        'location': str(component.get('location', ''))[:200],
+        'start_time': start_time,
+        'end_time': end_time,
+        'rrule': rule,
+        'exdates': exdates,
+        'recurrence_id': _naive(recurrence_id.dt) if recurrence_id else None
+    }
+
+
+def delete_events(event_ids, chunk_size=500):
+    """Supprime des événements, leurs occurrences modifiées et leurs groupes; renvoie le nombre supprimé"""
+    table = CalendarEvent.__table__
+    event_ids = list(event_ids)
+    removed = 0
+    for i in range(0, len(event_ids), chunk_size):
+        chunk = event_ids[i:i + chunk_size]
+        ids = select(table.c.id).where((table.c.id.in_(chunk)) | (table.c.parent_event_id.in_(chunk)))
+        db.session.execute(delete(event_groups).where(event_groups.c.event_id.in_(ids)))
+        removed += db.session.execute(delete(table).where(table.c.parent_event_id.in_(chunk))).rowcount
+        removed += db.session.execute(delete(table).where(table.c.id.in_(chunk))).rowcount
+    return removed
+
+
+class IcsImporter:
+    """Import d'un flux .ics dans un groupe, par lots"""
+    
+    def __init__(self, group_id, batch_size=500, subscription_id=None):
+        self.group_id = group_id
+        self.batch_size = batch_size
+        self.subscription_id = subscription_id
+        self.counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        if subscription_id:
+            self.counts['removed'] = 0
+        self.table = CalendarEvent.__table__
+        # UID et occurrences modifiées présents dans le flux
+        self.seen_uids = set()
+        self.seen_overrides = set()
+    
+    def run(self, stream, progress=None):
+        """Importe le flux; renvoie les compteurs created/updated/unchanged/skipped (et removed)"""
+        batch, series, overrides = [], [], []
+        seen = 0
+        for block in iter_vevents(stream):
+            seen += 1
+            # Un événement illisible n'est pas supprimé de l'abonnement
+            self.seen_uids.add(_block_uid(block))
+            try:
+                values = event_values(Event.from_ical('\r\n'.join(block) + '\r\n'))
+            except (ValueError, TypeError, AttributeError, KeyError, IndexError):
+                self.counts['skipped'] += 1
+                continue
+            
+            if values['recurrence_id']:
+                overrides.append(values)
+            elif values['rrule']:
+                series.append(values)
+            else:
+                batch.append(values)
+                if len(batch) >= self.batch_size:
+                    self._upsert(batch)
+                    batch = []
+                    if progress:
+                        progress(seen)
+        self._upsert(batch)
+        
+        # Les occurrences modifiées sont exclues de leur série
+        overridden = {}
+        for values in overrides:
+            overridden.setdefault(values['uid'], []).append(values['recurrence_id'])
+        for values in series:
+            values['exdates'] = values['exdates'] + overridden.get(values['uid'], [])
+        for i in range(0, len(series), self.batch_size):
+            self._upsert(series[i:i + self.batch_size])
+        self._upsert_overrides(overrides)
+        if self.subscription_id:
+            self._remove_stale()
+        if progress:
+            progress(seen)
+        return self.counts
+    
+    def _row(self, values):
+        """Ligne à écrire (colonnes de calendar_events)"""
+        row = {k: values[k] for k in ('uid', 'title', 'description', 'location', 'start_time', 'end_time', 'rrule')}
+        row['exdates'] = format_exdates(values['exdates']) if values['rrule'] else None
+        row['is_recurring'] = bool(values['rrule'])
+        row['recurrence_end'] = (series_end(values['rrule'], values['start_time'],
+                                            values['end_time'] - values['start_time'])
+                                 if values['rrule'] else None)
+        row['recurrence_id'] = None
+        row['subscription_id'] = self.subscription_id
+        return row
+    
+    def _changed(self, existing, row):
+        """Compare une ligne existante à la ligne importée"""
+        for field in FIELDS:
+            old, new = getattr(existing, field), row.get(field)
+            if field == 'exdates':
+                old, new = parse_exdates(old), parse_exdates(new)
+            if old != new:
+                return True
+        return False
+    
+    def _upsert(self, batch):
+        """Insère ou met à jour un lot d'événements identifiés par UID"""
+        if not batch:
+            return
+        # Un même UID répété dans le lot: la dernière version l'emporte
+        rows = {values['uid']: self._row(values) for values in batch}
+        table = self.table
+        existing = {r.uid: r for r in db.session.execute(
+            select(table).where(table.c.group_id == self.group_id, table.c.uid.in_(list(rows)))
+        )}
+        self._write(rows, existing, lambda uids: select(table.c.id).where(
+            table.c.group_id == self.group_id, table.c.uid.in_(uids)
+        ))
+    
+    def _upsert_overrides(self, overrides):
+        """Occurrences modifiées, rattachées à leur série par UID et RECURRENCE-ID"""
+        if not overrides:
+            return
+        table = self.table
+        parents = dict(db.session.execute(
+            select(table.c.uid, table.c.id).where(
+                table.c.group_id == self.group_id,
+                table.c.uid.in_({v['uid'] for v in overrides}),
+                table.c.rrule.isnot(None)
+            )
+        ).all())
+        
+        rows = {}
+        for values in overrides:
+            parent_id = parents.get(values['uid'])
+            if parent_id is None:
+                self.counts['skipped'] += 1
+                continue
+            row = self._row({**values, 'rrule': None, 'exdates': []})
+            row.update(uid=None, recurrence_id=values['recurrence_id'], parent_event_id=parent_id)
+            rows[(parent_id, values['recurrence_id'])] = row
+        self.seen_overrides.update(rows)
+        if not rows:
+            return
+        
+        key = tuple_(table.c.parent_event_id, table.c.recurrence_id)
+        existing = {(r.parent_event_id, r.recurrence_id): r for r in db.session.execute(
+            select(table).where(key.in_(list(rows)))
+        )}
+        self._write(rows, existing, lambda keys: select(table.c.id).where(key.in_(keys)))
+    
+    def _write(self, rows, existing, select_ids):
+        """Écrit les lignes nouvelles (INSERT) et modifiées (UPDATE) en requêtes groupées"""
+        table = self.table
+        created = {key: row for key, row in rows.items() if key not in existing}
+        changed = [(existing[key].id, row) for key, row in rows.items()
+                   if key in existing and self._changed(existing[key], row)]
+        self.counts['unchanged'] += len(rows) - len(created) - len(changed)
+        
+        if created:
+            now = datetime.utcnow()
+            db.session.execute(insert(table), [
+                {'parent_event_id': None, **row, 'group_id': self.group_id, 'sequence': 0, 'created_at': now}
+                for row in created.values()
+            ])
+            # Rattacher les lignes créées au groupe
+            ids = db.session.execute(select_ids(list(created))).scalars().all()
+            db.session.execute(insert(event_groups), [{'event_id': i, 'group_id': self.group_id} for i in ids])
+            self.counts['created'] += len(created)
+        
+        if changed:
+            columns = list(changed[0][1])
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('_id')).values(
+                    {**{c: bindparam(f'v_{c}') for c in columns}, 'sequence': table.c.sequence + 1}
+                ),
+                [{'_id': event_id, **{f'v_{c}': row[c] for c in columns}} for event_id, row in changed]
+            )
+            self.counts['updated'] += len(changed)
+    
+    def _remove_stale(self):
+        """Supprime les événements de l'abonnement absents du flux"""
+        table = self.table
+        rows = db.session.execute(
+            select(table.c.id, table.c.uid, table.c.parent_event_id, table.c.recurrence_id).where(
+                table.c.subscription_id == self.subscription_id
+            )
+        ).all()
+        stale = [r.id for r in rows if (
+            (r.parent_event_id, r.recurrence_id) not in self.seen_overrides if r.recurrence_id
+            else r.uid not in self.seen_uids
+        )]
+        self.counts['removed'] += delete_events(stale, self.batch_size)
@@ -0,0 +1,169 @@
+"""Tâches de fond (génération de documents, imports volumineux)
+
+Une tâche est une fonction ``fn(job, *args)`` exécutée dans un pool de
+threads, dans un contexte d'application Flask. Elle signale sa progression
+avec ``job.progress(done, total)`` et peut produire un fichier de résultat
+(``job.result_path``) téléchargeable via ``/api/v1/jobs/<id>/download``.
+
+L'état des tâches est enregistré dans la table ``jobs`` au lancement, au
+démarrage et à la fin de la tâche: il est consultable depuis tous les
+processus de l'application, et les fichiers produits doivent donc être
+écrits sur un disque partagé (``REPORTS_FOLDER``). La progression pendant
+l'exécution n'est tenue qu'en mémoire par le processus qui exécute la tâche
+(une tâche peut garder une transaction ouverte, qui bloquerait ces écritures
+sous SQLite). Les tâches et leurs fichiers sont supprimés
+``JOBS_RETENTION_SECONDS`` après leur fin.
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+from core.extensions import db
+from core.models import JobRecord
+
+# Colonnes de la table jobs écrites depuis l'objet Job
+COLUMNS = ('kind', 'owner_id', 'status', 'done', 'total', 'result', 'result_path', 'error',
+           'created_at', 'finished_at')
+
+
+class Job:
+    """Tâche de fond et sa progression"""
+    
+    def __init__(self, kind, owner_id):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner_id = owner_id
+        self.status = 'pending'  # pending, running, done, failed
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.result_path = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+    
+    @classmethod
+    def from_row(cls, row):
+        """Tâche lue dans la table jobs (lancée par un autre processus)"""
+        job = cls(row.kind, row.owner_id)
+        job.id = row.id
+        for column in COLUMNS:
+            setattr(job, column, getattr(row, column))
+        return job
+    
+    def values(self):
+        """Colonnes de la ligne jobs"""
+        return {column: getattr(self, column) for column in COLUMNS}
+    
+    def progress(self, done, total=None):
+        """Met à jour l'avancement"""
+        self.done = done
+        if total is not None:
+            self.total = total
+    
+    def to_dict(self):
+        """Sérialisation en dictionnaire"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'progress': round(self.done / self.total, 4) if self.total else None,
+            'result': self.result,
+            'has_file': self.result_path is not None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobRegistry:
+    """Registre des tâches: exécution dans le processus, état partagé en base"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = None
+    
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                workers = current_app.config.get('JOBS_MAX_WORKERS', 2)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+            return self._executor
+    
+    def submit(self, kind, owner_id, fn, *args):
+        """Lance fn(job, *args) en arrière-plan et renvoie la tâche"""
+        self._prune()
+        job = Job(kind, owner_id)
+        # Connexion distincte: la session de la requête n'est pas validée
+        with db.engine.begin() as connection:
+            connection.execute(insert(JobRecord.__table__).values(id=job.id, **job.values()))
+        with self._lock:
+            self._jobs[job.id] = job
+        app = current_app._get_current_object()
+        self._get_executor().submit(self._run, app, job, fn, args)
+        return job
+    
+    @staticmethod
+    def _save(job):
+        """Enregistre l'état de la tâche dans la table jobs"""
+        table = JobRecord.__table__
+        with db.engine.begin() as connection:
+            connection.execute(update(table).where(table.c.id == job.id).values(**job.values()))
+    
+    def _run(self, app, job, fn, args):
+        job.status = 'running'
+        with app.app_context():
+            try:
+                self._save(job)
+                job.result = fn(job, *args)
+                job.status = 'done'
+            except Exception as e:
+                app.logger.exception('Job %s (%s) failed', job.id, job.kind)
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = datetime.utcnow()
+                # Libérer la transaction de la tâche avant d'écrire son état
+                db.session.remove()
+                try:
+                    self._save(job)
+                except Exception:
+                    app.logger.exception('Job %s: state not saved', job.id)
+    
+    def get(self, job_id):
+        """Tâche par identifiant (None si inconnue ou expirée)"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # Tâche lancée par un autre processus: état enregistré en base
+        table = JobRecord.__table__
+        row = db.session.execute(select(table).where(table.c.id == job_id)).first()
+        return Job.from_row(row) if row else None
+    
+    def _prune(self):
+        """Supprime les tâches terminées depuis plus de JOBS_RETENTION_SECONDS (et leurs fichiers)"""
+        retention = current_app.config.get('JOBS_RETENTION_SECONDS', 86400)
+        cutoff = datetime.utcnow() - timedelta(seconds=retention)
+        with self._lock:
+            for job in [j for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job.id]
+        
+        table = JobRecord.__table__
+        with db.engine.begin() as connection:
+            expired = connection.execute(
+                select(table.c.id, table.c.result_path).where(table.c.finished_at < cutoff)
+            ).all()
+            if expired:
+                connection.execute(delete(table).where(table.c.id.in_([row.id for row in expired])))
+        for row in expired:
+            if row.result_path and os.path.exists(row.result_path):
+                os.remove(row.result_path)
+
+
+jobs = JobRegistry()
@@ -0,0 +1,172 @@
+"""Index en mémoire des appartenances utilisateur/groupe et parent/enfant
+
+L'index est construit une fois par processus (deux requêtes) et tenu à jour
+à partir des événements de session SQLAlchemy: les modifications des
+collections ``User.groups``, ``Group.members`` et ``User.children`` et les
+suppressions sont relevés à chaque flush, puis
+appliqués à l'index après le commit (et oubliés en cas de rollback).
+
+Les modifications faites par les autres processus sont prises en compte
+par une reconstruction complète toutes les ``MEMBERSHIP_INDEX_TTL`` secondes.
+"""
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from core.extensions import db
+from core.models import User, Group, user_groups, parent_children
+
+_EMPTY = frozenset()
+
+
+class MembershipIndex:
+    """Listes d'adjacence bidirectionnelles des appartenances"""
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._expires_at = 0.0
+        self._reset()
+    
+    def _reset(self):
+        self.user_groups = defaultdict(set)
+        self.group_members = defaultdict(set)
+        self.parent_children = defaultdict(set)
+        self.child_parents = defaultdict(set)
+    
+    def _ensure_loaded(self):
+        if time.monotonic() >= self._expires_at:
+            self.rebuild()
+    
+    def rebuild(self):
+        """Reconstruit l'index complet depuis la base"""
+        memberships = db.session.execute(select(user_groups.c.user_id, user_groups.c.group_id)).all()
+        families = db.session.execute(select(parent_children.c.parent_id, parent_children.c.child_id)).all()
+        
+        with self._lock:
+            self._reset()
+            for user_id, group_id in memberships:
+                self._add_member(user_id, group_id)
+            for parent_id, child_id in families:
+                self._add_child(parent_id, child_id)
+            self._expires_at = time.monotonic() + current_app.config.get('MEMBERSHIP_INDEX_TTL', 60)
+    
+    # Mises à jour élémentaires (appelées sous verrou)
+    
+    def _add_member(self, user_id, group_id):
+        self.user_groups[user_id].add(group_id)
+        self.group_members[group_id].add(user_id)
+    
+    def _remove_member(self, user_id, group_id):
+        self.user_groups[user_id].discard(group_id)
+        self.group_members[group_id].discard(user_id)
+    
+    def _add_child(self, parent_id, child_id):
+        self.parent_children[parent_id].add(child_id)
+        self.child_parents[child_id].add(parent_id)
+    
+    def _remove_child(self, parent_id, child_id):
+        self.parent_children[parent_id].discard(child_id)
+        self.child_parents[child_id].discard(parent_id)
+    
+    def _drop_user(self, user_id):
+        for group_id in list(self.user_groups.pop(user_id, ())):
+            self.group_members[group_id].discard(user_id)
+        for child_id in self.parent_children.pop(user_id, ()):
+            self.child_parents[child_id].discard(user_id)
+        for parent_id in self.child_parents.pop(user_id, ()):
+            self.parent_children[parent_id].discard(user_id)
+    
+    def _drop_group(self, group_id):
+        for user_id in self.group_members.pop(group_id, ()):
+            self.user_groups[user_id].discard(group_id)
+    
+    def apply(self, operations):
+        """Applique les opérations relevées pendant une transaction validée"""
+        with self._lock:
+            for name, *args in operations:
+                getattr(self, '_' + name)(*args)
+    
+    # Lectures
+    
+    def groups_of(self, user_id):
+        """Groupes de l'utilisateur"""
+        self._ensure_loaded()
+        with self._lock:
+            return frozenset(self.user_groups.get(user_id, _EMPTY))
+    
+    def groups_of_users(self, user_ids):
+        """Union des groupes de plusieurs utilisateurs"""
+        self._ensure_loaded()
+        with self._lock:
+            return frozenset().union(*[self.user_groups.get(uid, _EMPTY) for uid in user_ids])
+    
+    def is_member(self, user_id, group_id):
+        """L'utilisateur appartient-il au groupe ?"""
+        self._ensure_loaded()
+        return group_id in self.user_groups.get(user_id, _EMPTY)
+    
+    def shares_group(self, user_id, other_id):
+        """Les deux utilisateurs ont-ils au moins un groupe en commun ?"""
+        self._ensure_loaded()
+        with self._lock:
+            return not self.user_groups.get(user_id, _EMPTY).isdisjoint(self.user_groups.get(other_id, _EMPTY))
+    
+    def children_of(self, parent_id):
+        """Enfants du parent"""
+        self._ensure_loaded()
+        with self._lock:
+            return frozenset(self.parent_children.get(parent_id, _EMPTY))
+    
+    def is_parent_of(self, parent_id, child_id):
+        """L'utilisateur est-il parent de l'enfant ?"""
+        self._ensure_loaded()
+        return child_id in self.parent_children.get(parent_id, _EMPTY)
+
+
+membership_index = MembershipIndex()
+
+
+def _changes(state, key):
+    """Valeurs ajoutées et retirées d'un attribut depuis le dernier flush"""
+    history = state.attrs[key].history
+    return history.added or (), history.deleted or ()
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_membership_changes(session, flush_context):
+    """Relève les changements d'appartenance d'un flush"""
+    operations = session.info.setdefault('membership_operations', [])
+    
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            operations.append(('drop_user', obj.id))
+        elif isinstance(obj, Group):
+            operations.append(('drop_group', obj.id))
+    
+    for obj in list(session.new) + list(session.dirty):
+        state = inspect(obj)
+        if isinstance(obj, User):
+            added, removed = _changes(state, 'groups')
+            operations += [('add_member', obj.id, g.id) for g in added]
+            operations += [('remove_member', obj.id, g.id) for g in removed]
+            added, removed = _changes(state, 'children')
+            operations += [('add_child', obj.id, c.id) for c in added]
+            operations += [('remove_child', obj.id, c.id) for c in removed]
+        elif isinstance(obj, Group):
+            added, removed = _changes(state, 'members')
+            operations += [('add_member', u.id, obj.id) for u in added]
+            operations += [('remove_member', u.id, obj.id) for u in removed]
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_membership_changes(session):
+    operations = session.info.pop('membership_operations', None)
+    if operations:
+        membership_index.apply(operations)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_membership_changes(session):
+    session.info.pop('membership_operations', None)
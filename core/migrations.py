@@ -0,0 +1,222 @@
+"""Migrations versionnées du schéma de la base de données
+
+Chaque migration est une fonction numérotée appliquée une seule fois, dans
+l'ordre, sur la base existante. Les versions appliquées sont enregistrées
+dans la table ``schema_migrations``. Les migrations doivent rester
+idempotentes: sur une base neuve, ``db.create_all()`` a déjà créé le schéma
+complet et elles ne font alors qu'enregistrer leur version.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import delete, exists, inspect, select, update
+from sqlalchemy.schema import CreateColumn
+from core.extensions import db
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = db.Table('schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(100), nullable=False),
+    db.Column('applied_at', db.DateTime, default=datetime.utcnow)
+)
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Décorateur pour enregistrer une migration"""
+    def decorator(f):
+        MIGRATIONS.append((version, name, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+
+def _find_index(name):
+    """Retrouve un index déclaré dans les modèles"""
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(f'Unknown index: {name}')
+
+
+def create_indexes(connection, *names):
+    """Crée les index déclarés dans les modèles s'ils n'existent pas encore"""
+    for name in names:
+        _find_index(name).create(bind=connection, checkfirst=True)
+
+
+def add_columns(connection, table_name, *column_names):
+    """Ajoute les colonnes déclarées dans les modèles qui manquent à la table"""
+    existing = {c['name'] for c in inspect(connection).get_columns(table_name)}
+    table = db.metadata.tables[table_name]
+    for name in column_names:
+        if name in existing:
+            continue
+        ddl = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {ddl}')
+
+
+def applied_versions(connection):
+    """Versions déjà appliquées sur la base"""
+    return {row.version for row in connection.execute(schema_migrations.select())}
+
+
+def run_migrations():
+    """Crée les tables manquantes puis applique les migrations en attente"""
+    # Import des modèles pour que toutes les tables soient déclarées
+    import core.models  # noqa: F401
+
+    db.create_all()
+
+    with db.engine.connect() as connection:
+        done = applied_versions(connection)
+
+    applied = []
+    for version, name, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        # Une transaction par migration: une erreur n'enregistre pas la version
+        with db.engine.begin() as connection:
+            upgrade(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        logger.info('Applied migration %04d_%s', version, name)
+        applied.append((version, name))
+
+    return applied
+
+
+@migration(1, 'hot_query_indexes')
+def _hot_query_indexes(connection):
+    """Index secondaires sur les colonnes filtrées et triées par les routes"""
+    create_indexes(
+        connection,
+        'ix_user_groups_group_user',
+        'ix_parent_children_child',
+        'ix_announcements_created_at',
+        'ix_homework_completions_user_homework',
+        'ix_homeworks_group_due_date',
+        'ix_homeworks_author_due_date',
+        'ix_message_recipients_user_message',
+        'ix_messages_sender_created_at',
+        'ix_messages_created_at',
+        'ix_calendar_events_group_start_time',
+        'ix_calendar_events_parent_event_id',
+        'ix_notes_student_id',
+        'ix_notes_teacher_id',
+    )
+
+
+@migration(2, 'users_claims_version')
+def _users_claims_version(connection):
+    """Version des claims JWT par utilisateur"""
+    add_columns(connection, 'users', 'claims_version')
+
+
+@migration(3, 'notes_assessment_id')
+def _notes_assessment_id(connection):
+    """Identifiant d'évaluation des notes saisies en groupe"""
+    add_columns(connection, 'notes', 'assessment_id')
+    create_indexes(connection, 'ix_notes_assessment_id')
+
+
+@migration(4, 'grade_aggregates')
+def _grade_aggregates(connection):
+    """Calcul initial des agrégats de notes (table créée par create_all)"""
+    from core.grade_aggregates import rebuild
+    rebuild(connection)
+
+
+@migration(5, 'calendar_events_end_time_index')
+def _calendar_events_end_time_index(connection):
+    """Index des événements par groupe et date de fin (recherche par période)"""
+    create_indexes(connection, 'ix_calendar_events_group_end_time')
+
+
+@migration(6, 'calendar_rrule')
+def _calendar_rrule(connection):
+    """Séries RRULE: colonnes de récurrence et conversion des instances matérialisées"""
+    add_columns(connection, 'calendar_events', 'rrule', 'exdates', 'sequence', 'recurrence_id')
+    from core.recurrence import convert_legacy_series
+    convert_legacy_series(connection)
+
+
+def _collapse_duplicate_events(connection, events, event_groups, top_level):
+    """Fusionne les copies d'un même événement créées pour plusieurs groupes
+
+    Les copies ont le même contenu, le même horaire, le même créateur et le
+    même parent; la plus ancienne est conservée et reçoit les groupes des autres.
+    """
+    key = [events.c.title, events.c.description, events.c.location, events.c.start_time,
+           events.c.end_time, events.c.created_by, events.c.parent_event_id, events.c.recurrence_id,
+           events.c.rrule, events.c.exdates]
+    parent = events.c.parent_event_id.is_(None) if top_level else events.c.parent_event_id.isnot(None)
+    rows = connection.execute(
+        select(events.c.id, *key)
+        .where(events.c.created_by.isnot(None), parent)
+        .order_by(events.c.id)
+    ).all()
+    
+    survivors = {}
+    duplicates = {}
+    for row in rows:
+        survivor = survivors.setdefault(tuple(row[1:]), row.id)
+        if survivor != row.id:
+            duplicates[row.id] = survivor
+    
+    for duplicate, survivor in duplicates.items():
+        linked = {r.group_id for r in connection.execute(
+            select(event_groups.c.group_id).where(event_groups.c.event_id == survivor))}
+        for r in connection.execute(select(event_groups.c.group_id).where(event_groups.c.event_id == duplicate)):
+            if r.group_id not in linked:
+                connection.execute(event_groups.insert().values(event_id=survivor, group_id=r.group_id))
+                linked.add(r.group_id)
+        # Les occurrences modifiées suivent la série conservée
+        connection.execute(update(events).where(events.c.parent_event_id == duplicate)
+                           .values(parent_event_id=survivor))
+        connection.execute(delete(event_groups).where(event_groups.c.event_id == duplicate))
+        connection.execute(delete(events).where(events.c.id == duplicate))
+    return len(duplicates)
+
+
+@migration(7, 'event_groups')
+def _event_groups(connection):
+    """Événements partagés entre groupes: table event_groups et fusion des copies"""
+    events = db.metadata.tables['calendar_events']
+    event_groups = db.metadata.tables['event_groups']
+    
+    # Un lien par événement existant vers son groupe
+    connection.execute(event_groups.insert().from_select(
+        ['event_id', 'group_id'],
+        select(events.c.id, events.c.group_id).where(~exists().where(
+            event_groups.c.event_id == events.c.id, event_groups.c.group_id == events.c.group_id
+        ))
+    ))
+    
+    # Séries et événements simples d'abord, puis les occurrences rattachées
+    collapsed = _collapse_duplicate_events(connection, events, event_groups, top_level=True)
+    collapsed += _collapse_duplicate_events(connection, events, event_groups, top_level=False)
+    logger.info('Collapsed %d duplicate calendar events', collapsed)
+
+
+@migration(8, 'calendar_events_uid')
+def _calendar_events_uid(connection):
+    """UID iCalendar des événements importés, unique par groupe"""
+    add_columns(connection, 'calendar_events', 'uid')
+    create_indexes(connection, 'ux_calendar_events_group_uid')
+
+
+@migration(9, 'calendar_subscriptions')
+def _calendar_subscriptions(connection):
+    """Événements issus d'un abonnement .ics (table créée par create_all)"""
+    add_columns(connection, 'calendar_events', 'subscription_id')
+    create_indexes(connection, 'ix_calendar_events_subscription_id')
+
+
+@migration(10, 'notes_assessment_label')
+def _notes_assessment_label(connection):
+    """Intitulé des évaluations saisies en groupe"""
+    add_columns(connection, 'notes', 'assessment_label')
@@ -1,18 +1,32 @@
 """Modèles de base de données pour OpenDirecte"""
 from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import column_property, joinedload, selectinload
 from core.extensions import db
+from core.recurrence import parse_exdates
 
 
 # Table d'association pour la relation many-to-many User-Group
 user_groups = db.Table('user_groups',
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('group_id', db.Integer, db.ForeignKey('groups.id'), primary_key=True)
+    db.Column('group_id', db.Integer, db.ForeignKey('groups.id'), primary_key=True),
+    # Parcours inverse groupe -> membres (la clé primaire commence par user_id)
+    db.Index('ix_user_groups_group_user', 'group_id', 'user_id')
 )
 
 # Table d'association pour la relation many-to-many Parent-Enfant
 parent_children = db.Table('parent_children',
     db.Column('parent_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('child_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    db.Column('child_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Index('ix_parent_children_child', 'child_id')
+)
+
+# Table d'association pour la relation many-to-many Événement-Groupe
+# (un cours commun à plusieurs classes est une seule ligne de calendar_events)
+event_groups = db.Table('event_groups',
+    db.Column('event_id', db.Integer, db.ForeignKey('calendar_events.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('group_id', db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_event_groups_group_event', 'group_id', 'event_id')
 )
 
 
@@ -25,6 +39,8 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # eleve, prof, admin, parent
+    # Incrémentée à chaque changement de rôle/groupes/enfants: invalide les claims JWT
+    claims_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relations
@@ -42,6 +58,16 @@ class User(db.Model):
                                secondaryjoin=id==parent_children.c.child_id,
                                backref=db.backref('parents', lazy='dynamic'))
     
+    @staticmethod
+    def eager_options(include_groups=True, include_children=False):
+        """Options de chargement des relations utilisées par to_dict"""
+        options = []
+        if include_groups:
+            options.append(selectinload(User.groups))
+        if include_children:
+            options.append(selectinload(User.children))
+        return options
+    
     def to_dict(self, include_groups=True, include_children=False):
         """Sérialisation en dictionnaire"""
         data = {
@@ -71,6 +97,11 @@ class Group(db.Model):
     homeworks = db.relationship('Homework', backref='group', cascade='all, delete-orphan')
     events = db.relationship('CalendarEvent', backref='group', cascade='all, delete-orphan')
     
+    @staticmethod
+    def eager_options(include_members=True):
+        """Options de chargement des relations utilisées par to_dict"""
+        return [selectinload(Group.members)] if include_members else []
+    
     def to_dict(self, include_members=True):
         """Sérialisation en dictionnaire"""
         data = {
@@ -87,6 +118,9 @@ class Group(db.Model):
 class Announcement(db.Model):
     """Modèle Annonce (Feed)"""
     __tablename__ = 'announcements'
+    __table_args__ = (
+        db.Index('ix_announcements_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -97,6 +131,11 @@ class Announcement(db.Model):
     
     author = db.relationship('User', backref='announcements')
     
+    @staticmethod
+    def eager_options():
+        """Options de chargement des relations utilisées par to_dict"""
+        return [joinedload(Announcement.author)]
+    
     def to_dict(self):
         """Sérialisation en dictionnaire"""
         return {
@@ -114,13 +153,20 @@ class Announcement(db.Model):
 homework_completions = db.Table('homework_completions',
     db.Column('homework_id', db.Integer, db.ForeignKey('homeworks.id'), primary_key=True),
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('completed_at', db.DateTime, default=datetime.utcnow)
+    db.Column('completed_at', db.DateTime, default=datetime.utcnow),
+    db.Index('ix_homework_completions_user_homework', 'user_id', 'homework_id')
 )
 
 
 class Homework(db.Model):
     """Modèle Devoir"""
     __tablename__ = 'homeworks'
+    __table_args__ = (
+        # Élèves/parents: group_id IN (...) ORDER BY due_date
+        db.Index('ix_homeworks_group_due_date', 'group_id', 'due_date'),
+        # Profs: author_id = ? ORDER BY due_date
+        db.Index('ix_homeworks_author_due_date', 'author_id', 'due_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -136,8 +182,16 @@ class Homework(db.Model):
     attachment = db.relationship('Attachment', foreign_keys=[attachment_id])
     completed_by = db.relationship('User', secondary=homework_completions, backref='completed_homeworks')
     
-    def to_dict(self, user_id=None):
-        """Sérialisation en dictionnaire"""
+    @staticmethod
+    def eager_options(include_completions=False):
+        """Options de chargement des relations utilisées par to_dict"""
+        options = [joinedload(Homework.group), joinedload(Homework.author)]
+        if include_completions:
+            options.append(selectinload(Homework.completed_by))
+        return options
+    
+    def to_dict(self, user_id=None, is_completed=None):
+        """Sérialisation en dictionnaire (is_completed: complétion déjà calculée par la requête)"""
         data = {
             'id': self.id,
             'title': self.title,
@@ -153,7 +207,9 @@ class Homework(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
         
-        if user_id:
+        if is_completed is not None:
+            data['is_completed'] = bool(is_completed)
+        elif user_id:
             data['is_completed'] = any(u.id == user_id for u in self.completed_by)
         
         return data
@@ -162,13 +218,20 @@ class Homework(db.Model):
 # Table d'association pour Message recipients
 message_recipients = db.Table('message_recipients',
     db.Column('message_id', db.Integer, db.ForeignKey('messages.id'), primary_key=True),
-    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    # Boîte de réception: user_id = ? (la clé primaire commence par message_id)
+    db.Index('ix_message_recipients_user_message', 'user_id', 'message_id')
 )
 
 
 class Message(db.Model):
     """Modèle Message"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Messages envoyés: sender_id = ? ORDER BY created_at DESC
+        db.Index('ix_messages_sender_created_at', 'sender_id', 'created_at'),
+        db.Index('ix_messages_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     subject = db.Column(db.String(200), nullable=False)
@@ -180,6 +243,11 @@ class Message(db.Model):
     
     attachment = db.relationship('Attachment', foreign_keys=[attachment_id])
     
+    @staticmethod
+    def eager_options():
+        """Options de chargement des relations utilisées par to_dict"""
+        return [joinedload(Message.sender), selectinload(Message.recipients)]
+    
     def to_dict(self):
         """Sérialisation en dictionnaire"""
         return {
@@ -198,6 +266,16 @@ class Message(db.Model):
 class CalendarEvent(db.Model):
     """Modèle Événement calendrier"""
     __tablename__ = 'calendar_events'
+    __table_args__ = (
+        # group_id IN (...) et tri/filtre sur start_time
+        db.Index('ix_calendar_events_group_start_time', 'group_id', 'start_time'),
+        # Recherche par période: chevauchement start_time < fin et end_time > début
+        db.Index('ix_calendar_events_group_end_time', 'group_id', 'end_time'),
+        # Événements importés: un UID iCalendar par groupe
+        db.Index('ux_calendar_events_group_uid', 'group_id', 'uid', unique=True),
+        db.Index('ix_calendar_events_subscription_id', 'subscription_id'),
+        db.Index('ix_calendar_events_parent_event_id', 'parent_event_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -205,20 +283,56 @@ class CalendarEvent(db.Model):
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
     location = db.Column(db.String(200), nullable=True)
-    group_id = db.Column(db.Integer, db.ForeignKey('groups.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id'), nullable=False)  # groupe principal
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     
-    # Champs de récurrence
+    # Champs de récurrence: une série est une seule ligne (rrule), développée à la lecture
     is_recurring = db.Column(db.Boolean, default=False)
     recurrence_type = db.Column(db.String(20), nullable=True)  # weekly, biweekly, monthly
-    recurrence_end = db.Column(db.DateTime, nullable=True)
+    recurrence_end = db.Column(db.DateTime, nullable=True)  # fin de la dernière occurrence (None: infinie)
+    rrule = db.Column(db.String(500), nullable=True)  # RFC 5545, ex. FREQ=WEEKLY;UNTIL=20260630T235959
+    exdates = db.Column(db.Text, nullable=True)  # occurrences exclues, AAAAMMJJTHHMMSS séparés par des virgules
+    sequence = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # version de la série
+    # Occurrence modifiée: parent_event_id = série, recurrence_id = début d'origine
     parent_event_id = db.Column(db.Integer, db.ForeignKey('calendar_events.id'), nullable=True)
+    recurrence_id = db.Column(db.DateTime, nullable=True)
+    uid = db.Column(db.String(255), nullable=True)  # UID iCalendar des événements importés
+    subscription_id = db.Column(db.Integer, db.ForeignKey('calendar_subscriptions.id', ondelete='SET NULL'), nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relations
     creator = db.relationship('User', foreign_keys=[created_by], backref='created_events')
     parent_event = db.relationship('CalendarEvent', remote_side=[id], backref='recurring_instances')
+    # Tous les groupes concernés (dont le groupe principal)
+    groups = db.relationship('Group', secondary=event_groups, backref='shared_events')
+    
+    @staticmethod
+    def eager_options():
+        """Options de chargement des relations utilisées par to_dict"""
+        return [joinedload(CalendarEvent.group), joinedload(CalendarEvent.creator),
+                selectinload(CalendarEvent.groups)]
+    
+    @staticmethod
+    def of_groups(group_ids):
+        """Condition des événements qui concernent au moins un des groupes"""
+        return CalendarEvent.id.in_(
+            db.select(event_groups.c.event_id).where(event_groups.c.group_id.in_(group_ids))
+        )
+    
+    @staticmethod
+    def window_filter(start=None, end=None):
+        """Conditions des événements (ou séries) qui chevauchent la période [start, end)"""
+        clauses = []
+        if end:
+            clauses.append(CalendarEvent.start_time < end)
+        if start:
+            clauses.append(or_(
+                CalendarEvent.end_time > start,
+                and_(CalendarEvent.rrule.isnot(None),
+                     or_(CalendarEvent.recurrence_end.is_(None), CalendarEvent.recurrence_end > start))
+            ))
+        return clauses
     
     def to_dict(self):
         """Sérialisation en dictionnaire"""
@@ -231,30 +345,94 @@ class CalendarEvent(db.Model):
             'location': self.location,
             'group_id': self.group_id,
             'group_name': self.group.name if self.group else None,
+            'group_ids': [g.id for g in self.groups],
+            'groups': [{'id': g.id, 'name': g.name} for g in self.groups],
             'created_by': self.created_by,
             'creator_name': self.creator.username if self.creator else None,
             'is_recurring': self.is_recurring,
             'recurrence_type': self.recurrence_type,
             'recurrence_end': self.recurrence_end.isoformat() if self.recurrence_end else None,
+            'rrule': self.rrule,
+            'exdates': [d.isoformat() for d in parse_exdates(self.exdates)],
+            'sequence': self.sequence,
             'parent_event_id': self.parent_event_id,
+            'recurrence_id': self.recurrence_id.isoformat() if self.recurrence_id else None,
+            'uid': self.uid,
+            'subscription_id': self.subscription_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 
+class CalendarSubscription(db.Model):
+    """Modèle Abonnement à un calendrier .ics publié (synchronisé périodiquement)"""
+    __tablename__ = 'calendar_subscriptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id'), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    interval_minutes = db.Column(db.Integer, nullable=False, default=60)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Requêtes conditionnelles: validateurs renvoyés par le serveur au dernier téléchargement
+    etag = db.Column(db.String(255), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # updated, not_modified, error
+    last_error = db.Column(db.Text, nullable=True)
+    
+    # Relations
+    group = db.relationship('Group', backref=db.backref('calendar_subscriptions', cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        """Sérialisation en dictionnaire"""
+        return {
+            'id': self.id,
+            'group_id': self.group_id,
+            'group_name': self.group.name if self.group else None,
+            'url': self.url,
+            'interval_minutes': self.interval_minutes,
+            'enabled': self.enabled,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_synced_at': self.last_synced_at.isoformat() if self.last_synced_at else None,
+            'last_status': self.last_status,
+            'last_error': self.last_error
+        }
+
+
 class Note(db.Model):
     """Modèle Note"""
     __tablename__ = 'notes'
+    __table_args__ = (
+        db.Index('ix_notes_student_id', 'student_id'),
+        db.Index('ix_notes_teacher_id', 'teacher_id'),
+        db.Index('ix_notes_assessment_id', 'assessment_id'),
+    )
     
+    # active_history: l'ancienne valeur est chargée avant modification, même
+    # sur une instance expirée, pour retirer la note de son agrégat (core/grade_aggregates.py)
     id = db.Column(db.Integer, primary_key=True)
-    subject = db.Column(db.String(100), nullable=False)
-    value = db.Column(db.Float, nullable=False)
-    max_value = db.Column(db.Float, default=20.0)
+    subject = column_property(db.Column(db.String(100), nullable=False), active_history=True)
+    value = column_property(db.Column(db.Float, nullable=False), active_history=True)
+    max_value = column_property(db.Column(db.Float, default=20.0), active_history=True)
     comment = db.Column(db.Text, nullable=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    student_id = column_property(db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False),
+                                 active_history=True)
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Évaluation commune aux notes saisies ensemble (saisie groupée)
+    assessment_id = db.Column(db.String(36), nullable=True)
+    # Intitulé de l'évaluation (commentaire commun de la saisie groupée)
+    assessment_label = db.Column(db.String(200), nullable=True)
+    created_at = column_property(db.Column(db.DateTime, default=datetime.utcnow), active_history=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    @staticmethod
+    def eager_options():
+        """Options de chargement des relations utilisées par to_dict"""
+        return [joinedload(Note.student), joinedload(Note.teacher)]
+    
     def to_dict(self):
         """Sérialisation en dictionnaire"""
         return {
@@ -267,11 +445,36 @@ class Note(db.Model):
             'student': self.student.username if self.student else None,
             'teacher_id': self.teacher_id,
             'teacher': self.teacher.username if self.teacher else None,
+            'assessment_id': self.assessment_id,
+            'assessment_label': self.assessment_label,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+class GradeAggregate(db.Model):
+    """Modèle Agrégat de notes par élève, matière et trimestre
+
+    Tenu à jour à chaque écriture de note (voir core/grade_aggregates.py):
+    la moyenne sur 20 vaut 20 * sum_normalized / weight_sum.
+    """
+    __tablename__ = 'grade_aggregates'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'subject', 'term', name='uq_grade_aggregates_student_subject_term'),
+        db.Index('ix_grade_aggregates_subject_term', 'subject', 'term'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Sans clé étrangère: les lignes disparaissent avec la dernière note de l'élève
+    student_id = db.Column(db.Integer, nullable=False)
+    subject = db.Column(db.String(100), nullable=False)
+    term = db.Column(db.String(20), nullable=False)  # ex: 2025-2026-T1
+    sum_normalized = db.Column(db.Float, nullable=False, default=0.0)  # somme des value / max_value
+    weight_sum = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class Attachment(db.Model):
     """Modèle Pièce jointe"""
     __tablename__ = 'attachments'
@@ -296,3 +499,49 @@ class Attachment(db.Model):
             'uploader_id': self.uploader_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class RevokedToken(db.Model):
+    """Modèle Token révoqué (liste de blocage JWT)
+
+    Une ligne révoque soit un token précis (jti), soit tous les tokens d'un
+    utilisateur émis avant revoked_before. Elle peut être supprimée dès
+    expires_at: les tokens concernés ont alors tous expiré.
+    """
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        db.Index('ix_revoked_tokens_user_id', 'user_id'),
+        db.Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    token_type = db.Column(db.String(10), nullable=True)  # access, refresh (None: tous)
+    revoked_before = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class JobRecord(db.Model):
+    """Modèle État d'une tâche de fond (partagé entre les processus)
+
+    La progression détaillée est tenue en mémoire par le processus qui
+    exécute la tâche; la ligne est écrite au lancement, au démarrage et à la fin.
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_finished_at', 'finished_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    owner_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    done = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    result_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -0,0 +1,118 @@
+"""Pagination par curseur (keyset)
+
+La page suivante est désignée par un curseur opaque qui encode les valeurs
+de la clé de tri (par exemple ``(created_at, id)``) du dernier élément
+renvoyé. La requête reprend juste après ces valeurs au lieu d'utiliser un
+OFFSET: une page profonde coûte autant que la première et aucun COUNT
+n'est exécuté sauf si le client le demande (``?with_total=1``).
+
+Paramètres de requête: ``limit``, ``cursor`` et ``with_total``. Sans
+``limit`` ni ``cursor``, les routes renvoient la liste complète comme avant.
+"""
+import base64
+import json
+from datetime import datetime
+from flask import abort, jsonify, make_response, request, current_app
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Query
+from core.extensions import db
+
+
+def encode_cursor(values):
+    """Encode les valeurs de la clé de tri en curseur opaque"""
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Décode un curseur opaque (ValueError si invalide)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(payload, list):
+        raise ValueError('Invalid cursor')
+    return tuple(datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v for v in payload)
+
+
+def _after(keys, values, descending):
+    """Prédicat « strictement après values » dans l'ordre des clés"""
+    clauses = []
+    for i, key in enumerate(keys):
+        prefix = [keys[j] == values[j] for j in range(i)]
+        step = key < values[i] if descending else key > values[i]
+        clauses.append(and_(*prefix, step))
+    return or_(*clauses)
+
+
+class Keyset:
+    """Paramètres de pagination par curseur d'une requête HTTP"""
+    
+    def __init__(self, cursor=None, limit=None, with_total=False):
+        self.cursor = cursor
+        self.limit = limit
+        self.with_total = with_total
+        self.keys = None
+        self.total = None
+        self.next_cursor = None
+    
+    @classmethod
+    def from_request(cls):
+        """Lit limit/cursor/with_total; None si la pagination n'est pas demandée"""
+        if 'cursor' not in request.args and 'limit' not in request.args:
+            return None
+        
+        max_limit = current_app.config.get('PAGINATION_MAX_LIMIT', 200)
+        limit = request.args.get('limit', current_app.config.get('PAGINATION_DEFAULT_LIMIT', 50), type=int)
+        limit = max(1, min(limit, max_limit))
+        
+        cursor = None
+        if request.args.get('cursor'):
+            try:
+                cursor = decode_cursor(request.args['cursor'])
+            except ValueError:
+                abort(make_response(jsonify({'error': 'Invalid cursor'}), 400))
+        
+        return cls(cursor=cursor, limit=limit, with_total=bool(request.args.get('with_total', type=int)))
+    
+    def apply(self, stmt, keys, descending=False):
+        """Applique tri, reprise après le curseur et limite à une Query ou un Select"""
+        self.keys = keys
+        if self.cursor is not None and len(self.cursor) != len(keys):
+            abort(make_response(jsonify({'error': 'Invalid cursor'}), 400))
+        
+        if self.with_total:
+            self.total = self.count(stmt)
+        
+        stmt = stmt.order_by(None).order_by(*[k.desc() if descending else k.asc() for k in keys])
+        if self.cursor is not None:
+            stmt = stmt.where(_after(keys, self.cursor, descending))
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        return stmt.limit(self.limit + 1)
+    
+    def count(self, stmt):
+        """Nombre total de lignes, hors curseur et limite"""
+        if isinstance(stmt, Query):
+            return stmt.order_by(None).count()
+        subquery = stmt.order_by(None).subquery()
+        return db.session.execute(select(func.count()).select_from(subquery)).scalar()
+    
+    def paginate(self, rows, key_of=None):
+        """Tronque les lignes à la limite et calcule le curseur suivant"""
+        if key_of is None:
+            def key_of(row):
+                return tuple(getattr(row, k.key) for k in self.keys)
+        rows = list(rows)
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            self.next_cursor = encode_cursor(key_of(rows[-1]))
+        return rows
+    
+    def meta(self):
+        """Métadonnées de pagination à ajouter à la réponse"""
+        data = {'next_cursor': self.next_cursor, 'limit': self.limit}
+        if self.with_total:
+            data['total'] = self.total
+        return data
@@ -1,16 +1,123 @@
 """Gestion des permissions et autorisations"""
+import time
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask import abort, jsonify, make_response, g, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
 from core.extensions import db
 from core.models import User
+from core.membership import membership_index
+
+# Cache process des versions de claims: user_id -> (version, expiration)
+_claims_versions = {}
+
+
+class Principal:
+    """Utilisateur authentifié décrit par les claims de son JWT
+    
+    Le rôle est lu dans le token; les appartenances (groupes, enfants) sont
+    vérifiées dans l'index en mémoire (core/membership.py). L'objet User n'est
+    chargé que si la route y accède via ``principal.user``.
+    """
+    __slots__ = ('id', 'role', 'claims_version', '_user')
+    
+    def __init__(self, id, role, claims_version, user=None):
+        self.id = id
+        self.role = role
+        self.claims_version = claims_version
+        self._user = user
+    
+    @classmethod
+    def from_claims(cls, user_id, claims):
+        """Construit le principal à partir des claims du token"""
+        return cls(user_id, claims['role'], claims['cv'])
+    
+    @classmethod
+    def from_user(cls, user):
+        """Construit le principal à partir de l'utilisateur en base"""
+        return cls(user.id, user.role, user.claims_version, user=user)
+    
+    @property
+    def user(self):
+        """Utilisateur ORM, chargé à la première utilisation"""
+        if self._user is None:
+            self._user = User.query.get(self.id)
+        return self._user
+
+
+def build_claims(user):
+    """Claims additionnels du JWT (rôle, groupes, version)"""
+    return {
+        'role': user.role,
+        'groups': [g.name for g in user.groups],
+        'cv': user.claims_version
+    }
+
+
+def current_claims_version(user_id):
+    """Version des claims de l'utilisateur (None s'il n'existe plus), mise en cache"""
+    now = time.monotonic()
+    cached = _claims_versions.get(user_id)
+    if cached and cached[1] > now:
+        return cached[0]
+    
+    version = db.session.query(User.claims_version).filter(User.id == user_id).scalar()
+    _claims_versions[user_id] = (version, now + current_app.config.get('CLAIMS_VERSION_TTL', 30))
+    return version
+
+
+def bump_claims_version(*user_ids):
+    """Invalide les claims des utilisateurs (à appeler avant le commit)"""
+    user_ids = [uid for uid in user_ids if uid is not None]
+    if not user_ids:
+        return
+    User.query.filter(User.id.in_(user_ids)).update(
+        {User.claims_version: User.claims_version + 1}, synchronize_session='fetch'
+    )
+    for user_id in user_ids:
+        _claims_versions.pop(user_id, None)
+
+
+def get_current_principal():
+    """Principal de la requête courante, construit une seule fois par requête"""
+    verify_jwt_in_request()
+    if 'principal' in g:
+        return g.principal
+    
+    user_id = int(get_jwt_identity())
+    claims = get_jwt()
+    version = current_claims_version(user_id)
+    
+    if version is not None and claims.get('cv') == version and 'role' in claims:
+        principal = Principal.from_claims(user_id, claims)
+    else:
+        # Claims absents ou périmés: relire l'utilisateur et signaler au client
+        # qu'il doit rafraîchir son token
+        user = User.query.get(user_id) if version is not None else None
+        if not user:
+            # Utilisateur supprimé depuis l'émission du token
+            abort(make_response(jsonify({'error': 'User not found'}), 404))
+        principal = Principal.from_user(user)
+        g.claims_stale = True
+    
+    g.principal = principal
+    return principal
 
 
 def get_current_user():
     """Récupère l'utilisateur actuel depuis le JWT"""
-    verify_jwt_in_request()
-    user_id = get_jwt_identity()
-    return User.query.get(int(user_id))
+    return get_current_principal().user
+
+
+def add_claims_headers(response):
+    """Indique au client que les claims de son token sont périmés"""
+    if g.get('claims_stale'):
+        response.headers['X-Claims-Stale'] = '1'
+    return response
+
+
+def group_ids_of_users(user_ids):
+    """Identifiants des groupes auxquels appartiennent les utilisateurs"""
+    return list(membership_index.groups_of_users(user_ids))
 
 
 def role_required(*roles):
@@ -18,9 +125,7 @@ def role_required(*roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            current_user = get_current_user()
-            if not current_user:
-                return jsonify({'error': 'User not found'}), 404
+            current_user = get_current_principal()
             if current_user.role not in roles:
                 return jsonify({'error': 'Insufficient permissions'}), 403
             return f(*args, **kwargs)
@@ -38,6 +143,11 @@ def prof_or_admin_required(f):
     return role_required('prof', 'admin')(f)
 
 
+def parent_required(f):
+    """Décorateur pour les endpoints réservés aux parents"""
+    return role_required('parent')(f)
+
+
 def parent_or_admin_required(f):
     """Décorateur pour les endpoints parent ou admin"""
     return role_required('parent', 'admin')(f)
@@ -50,11 +160,11 @@ def is_owner_or_admin(user, resource_user_id):
 
 def user_in_group(user, group_id):
     """Vérifie si l'utilisateur appartient au groupe"""
-    return any(g.id == group_id for g in user.groups)
+    return membership_index.is_member(user.id, group_id)
 
 
 def is_parent_of_child(parent, child_id):
     """Vérifie si l'utilisateur est le parent de l'enfant"""
     if parent.role != 'parent':
         return False
-    return any(c.id == child_id for c in parent.children)
+    return membership_index.is_parent_of(parent.id, child_id)
@@ -0,0 +1,148 @@
+"""Modèles de lecture pour les endpoints en lecture seule
+
+Les listes volumineuses (annuaire, élèves, boîte de réception) sont
+construites à partir de requêtes Core sur les seules colonnes utiles et
+matérialisées en objets légers à ``__slots__``: aucune instance ORM n'est
+chargée dans l'identity map de la session.
+"""
+from collections import defaultdict
+from sqlalchemy import select
+from core.extensions import db
+from core.models import User, Group, Message, user_groups, message_recipients
+
+users_t = User.__table__
+groups_t = Group.__table__
+messages_t = Message.__table__
+
+
+class UserSummary:
+    """Utilisateur réduit aux champs de l'annuaire"""
+    __slots__ = ('id', 'username', 'email', 'role')
+
+    def __init__(self, id, username, email, role):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+
+    def to_dict(self):
+        """Sérialisation en dictionnaire"""
+        return {'id': self.id, 'username': self.username, 'email': self.email, 'role': self.role}
+
+
+class StudentSummary:
+    """Élève avec les noms de ses groupes"""
+    __slots__ = ('id', 'username', 'email', 'groups')
+
+    def __init__(self, id, username, email, groups):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.groups = groups
+
+    def to_dict(self):
+        """Sérialisation en dictionnaire"""
+        return {'id': self.id, 'username': self.username, 'email': self.email, 'groups': self.groups}
+
+
+class MessageSummary:
+    """Message avec l'expéditeur et les destinataires déjà résolus"""
+    __slots__ = ('id', 'subject', 'content', 'sender_id', 'sender', 'recipients',
+                 'attachment_id', 'created_at', 'is_read')
+
+    def __init__(self, id, subject, content, sender_id, sender, attachment_id, created_at, is_read):
+        self.id = id
+        self.subject = subject
+        self.content = content
+        self.sender_id = sender_id
+        self.sender = sender
+        self.recipients = []
+        self.attachment_id = attachment_id
+        self.created_at = created_at
+        self.is_read = is_read
+
+    def to_dict(self):
+        """Sérialisation en dictionnaire (même format que Message.to_dict)"""
+        return {
+            'id': self.id,
+            'subject': self.subject,
+            'content': self.content,
+            'sender_id': self.sender_id,
+            'sender': self.sender,
+            'recipients': [{'id': rid, 'username': name} for rid, name in self.recipients],
+            'attachment_id': self.attachment_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'is_read': self.is_read
+        }
+
+
+def list_user_summaries():
+    """Tous les utilisateurs (annuaire de la messagerie)"""
+    stmt = select(users_t.c.id, users_t.c.username, users_t.c.email, users_t.c.role).order_by(users_t.c.id)
+    return [UserSummary(*row) for row in db.session.execute(stmt)]
+
+
+def list_student_summaries(group_ids=None):
+    """Élèves avec leurs groupes, éventuellement restreints à certains groupes"""
+    student_ids = select(users_t.c.id).where(users_t.c.role == 'eleve')
+    if group_ids is not None:
+        if not group_ids:
+            return []
+        student_ids = student_ids.where(users_t.c.id.in_(
+            select(user_groups.c.user_id).where(user_groups.c.group_id.in_(group_ids))
+        ))
+
+    # Noms des groupes de tous les élèves concernés en une seule requête
+    group_names = defaultdict(list)
+    stmt = select(user_groups.c.user_id, groups_t.c.name).join(
+        groups_t, groups_t.c.id == user_groups.c.group_id
+    ).where(user_groups.c.user_id.in_(student_ids))
+    for user_id, name in db.session.execute(stmt):
+        group_names[user_id].append(name)
+
+    stmt = select(users_t.c.id, users_t.c.username, users_t.c.email).where(
+        users_t.c.id.in_(student_ids)
+    ).order_by(users_t.c.id)
+    return [StudentSummary(id, username, email, group_names.get(id, []))
+            for id, username, email in db.session.execute(stmt)]
+
+
+def _message_summaries(condition, pager=None):
+    """Messages répondant à la condition, du plus récent au plus ancien"""
+    sender = users_t.alias('sender')
+    stmt = select(
+        messages_t.c.id, messages_t.c.subject, messages_t.c.content, messages_t.c.sender_id,
+        sender.c.username, messages_t.c.attachment_id, messages_t.c.created_at, messages_t.c.is_read
+    ).outerjoin(sender, sender.c.id == messages_t.c.sender_id).where(condition)
+    
+    keys = [messages_t.c.created_at, messages_t.c.id]
+    if pager:
+        stmt = pager.apply(stmt, keys, descending=True)
+    else:
+        stmt = stmt.order_by(*[k.desc() for k in keys])
+    
+    messages = [MessageSummary(*row) for row in db.session.execute(stmt)]
+    if pager:
+        messages = pager.paginate(messages)
+    if not messages:
+        return messages
+
+    # Destinataires de tous les messages en une seule requête
+    by_id = {m.id: m for m in messages}
+    stmt = select(message_recipients.c.message_id, users_t.c.id, users_t.c.username).join(
+        users_t, users_t.c.id == message_recipients.c.user_id
+    ).where(message_recipients.c.message_id.in_(list(by_id)))
+    for message_id, user_id, username in db.session.execute(stmt):
+        by_id[message_id].recipients.append((user_id, username))
+    return messages
+
+
+def inbox_summaries(user_id, pager=None):
+    """Messages reçus par l'utilisateur"""
+    received = select(message_recipients.c.message_id).where(message_recipients.c.user_id == user_id)
+    return _message_summaries(messages_t.c.id.in_(received), pager)
+
+
+def sent_summaries(user_id, pager=None):
+    """Messages envoyés par l'utilisateur"""
+    return _message_summaries(messages_t.c.sender_id == user_id, pager)
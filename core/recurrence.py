@@ -0,0 +1,227 @@
+"""Récurrence des événements du calendrier (RRULE, RFC 5545)
+
+Une série est stockée en une seule ligne: ``start_time``/``end_time``
+décrivent la première occurrence, ``rrule`` la règle de répétition et
+``exdates`` les occurrences supprimées (vacances, cours annulés). Une
+occurrence modifiée est une ligne distincte qui pointe vers la série
+(``parent_event_id``) avec son début d'origine (``recurrence_id``); ce début
+est ajouté aux ``exdates`` de la série.
+
+Les occurrences sont calculées à la lecture, uniquement sur la période
+demandée. Les expansions sont gardées dans un cache LRU indexé par série et
+version (``sequence``, incrémentée à chaque modification de la série).
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from dateutil.rrule import rrulestr
+from sqlalchemy import delete, select, update
+
+# Anciens types de récurrence et règle équivalente
+LEGACY_RULES = {
+    'weekly': 'FREQ=WEEKLY',
+    'biweekly': 'FREQ=WEEKLY;INTERVAL=2',
+    'monthly': 'FREQ=MONTHLY',
+}
+
+# Fréquences acceptées (les fréquences infra-journalières produiraient des
+# milliers d'occurrences par semaine)
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+
+# Parties refusées pour la même raison (plusieurs occurrences par jour)
+SUB_DAILY_PARTS = ('BYHOUR', 'BYMINUTE', 'BYSECOND')
+
+# Bornes d'une série finie: series_end parcourt ses occurrences
+MAX_COUNT = 1000
+MAX_SPAN = timedelta(days=10 * 366)
+
+# Sans période demandée, les séries sont développées jusqu'à cet horizon
+DEFAULT_HORIZON = timedelta(days=366)
+
+EXDATE_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def parse_exdates(text):
+    """Liste des dates exclues d'une série"""
+    if not text:
+        return []
+    return [datetime.strptime(value, EXDATE_FORMAT) for value in text.split(',') if value]
+
+
+def format_exdates(dates):
+    """Sérialise des dates exclues (triées, sans doublons)"""
+    return ','.join(d.strftime(EXDATE_FORMAT) for d in sorted(set(dates))) or None
+
+
+def add_exdate(event, occurrence):
+    """Exclut une occurrence d'une série et change sa version"""
+    event.exdates = format_exdates(parse_exdates(event.exdates) + [occurrence])
+    event.sequence = (event.sequence or 0) + 1
+
+
+def normalize_rule(rule, dtstart):
+    """Valide une règle RRULE et la renvoie sous forme normalisée (ValueError si invalide)"""
+    rule = (rule or '').strip().upper()
+    if rule.startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    parts = []
+    for part in rule.split(';'):
+        if not part:
+            continue
+        name, _, value = part.partition('=')
+        # Les dates sont stockées en UTC sans fuseau
+        if name == 'UNTIL':
+            value = value.rstrip('Z')
+        parts.append(f'{name}={value}')
+    rule = ';'.join(parts)
+    
+    options = dict(p.split('=', 1) for p in parts)
+    if options.get('FREQ') not in FREQUENCIES or any(p in options for p in SUB_DAILY_PARTS):
+        raise ValueError('Unsupported recurrence frequency')
+    try:
+        rrulestr(rule, dtstart=dtstart)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid recurrence rule: {e}')
+    
+    if 'COUNT' in options and int(options['COUNT']) > MAX_COUNT:
+        raise ValueError(f'Recurrence COUNT must not exceed {MAX_COUNT}')
+    if 'UNTIL' in options and _parse_until(options['UNTIL']) > dtstart + MAX_SPAN:
+        raise ValueError('Recurrence UNTIL is too far in the future')
+    return rule
+
+
+def _parse_until(value):
+    """Date UNTIL d'une règle (date seule ou date-heure)"""
+    return datetime.strptime(value, EXDATE_FORMAT if 'T' in value else '%Y%m%d')
+
+
+def legacy_rule(recurrence_type, recurrence_end=None):
+    """Règle équivalente à un type de récurrence (weekly, biweekly, monthly)"""
+    if recurrence_type not in LEGACY_RULES:
+        raise ValueError('Invalid recurrence type')
+    rule = LEGACY_RULES[recurrence_type]
+    if recurrence_end:
+        rule += f';UNTIL={recurrence_end.strftime(EXDATE_FORMAT)}'
+    return rule
+
+
+def series_end(rule, dtstart, duration):
+    """Fin de la dernière occurrence (None si la série est infinie)
+    
+    La règle est normalisée (normalize_rule): COUNT et UNTIL sont bornés, le
+    parcours de la série aussi.
+    """
+    if 'COUNT=' not in rule and 'UNTIL=' not in rule:
+        return None
+    last = dtstart
+    for last in rrulestr(rule, dtstart=dtstart):
+        pass
+    return last + duration
+
+
+def is_occurrence(event, start):
+    """Vérifie que start est le début d'une occurrence de la série"""
+    return start in rrulestr(event.rrule, dtstart=event.start_time)
+
+
+@lru_cache(maxsize=1024)
+def _occurrences(event_id, sequence, rule, dtstart, exdates, after, before):
+    """Débuts des occurrences dans ]after, before[ (clé de cache: série et version)"""
+    excluded = set(parse_exdates(exdates))
+    return tuple(d for d in rrulestr(rule, dtstart=dtstart).between(after, before) if d not in excluded)
+
+
+def expand_events(events, start=None, end=None):
+    """Sérialise les événements en développant les séries sur la période, triés par début"""
+    # Horizon arrondi au jour pour que les expansions restent en cache
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    items = []
+    for event in events:
+        if not event.rrule:
+            items.append((event.start_time, event.id, event.to_dict()))
+            continue
+        
+        duration = event.end_time - event.start_time
+        after = start - duration if start else event.start_time - timedelta(seconds=1)
+        before = end or (start or today) + DEFAULT_HORIZON
+        occurrences = _occurrences(event.id, event.sequence, event.rrule, event.start_time,
+                                   event.exdates or '', after, before)
+        if not occurrences:
+            continue
+        base = event.to_dict()
+        for occurrence in occurrences:
+            items.append((occurrence, event.id, {
+                **base,
+                'start_time': occurrence.isoformat(),
+                'end_time': (occurrence + duration).isoformat(),
+                'recurrence_id': occurrence.isoformat()
+            }))
+    
+    items.sort(key=lambda item: item[:2])
+    return [item[2] for item in items]
+
+
+def convert_legacy_series(connection):
+    """Convertit les séries matérialisées (une ligne par occurrence) en séries RRULE
+    
+    Les instances identiques à l'occurrence prévue sont supprimées; celles qui
+    ont été modifiées deviennent des occurrences modifiées et les occurrences
+    supprimées à l'unité des dates exclues. Renvoie le nombre de séries converties.
+    """
+    from core.models import CalendarEvent
+    table = CalendarEvent.__table__
+    # Anciens intervalles: « monthly » était une approximation de 30 jours
+    legacy_deltas = {'weekly': timedelta(weeks=1), 'biweekly': timedelta(weeks=2), 'monthly': timedelta(days=30)}
+    legacy_rules = {**LEGACY_RULES, 'monthly': 'FREQ=DAILY;INTERVAL=30'}
+    fields = ('title', 'description', 'location', 'group_id', 'created_by')
+    # Colonnes présentes à cette version du schéma (les suivantes, comme uid,
+    # ne sont pas encore ajoutées: ne pas lire toute la table du modèle)
+    columns = [table.c.id, table.c.start_time, table.c.end_time, *[table.c[f] for f in fields]]
+    
+    parents = connection.execute(select(*columns, table.c.recurrence_type, table.c.recurrence_end).where(
+        table.c.is_recurring.is_(True),
+        table.c.rrule.is_(None),
+        table.c.parent_event_id.is_(None),
+        table.c.recurrence_end.isnot(None),
+        table.c.recurrence_type.in_(list(legacy_deltas))
+    )).all()
+    
+    for parent in parents:
+        start = parent.start_time.replace(microsecond=0)
+        duration = parent.end_time - parent.start_time
+        delta = legacy_deltas[parent.recurrence_type]
+        # Occurrences créées par l'ancien code (au plus 52 après la première)
+        slots = []
+        current = start
+        while len(slots) < 52:
+            current += delta
+            if current > parent.recurrence_end:
+                break
+            slots.append(current)
+        last = slots[-1] if slots else start
+        
+        instances = connection.execute(select(*columns).where(
+            table.c.parent_event_id == parent.id, table.c.recurrence_id.is_(None)
+        )).all()
+        unchanged, overridden = [], []
+        for instance in instances:
+            slot = instance.start_time.replace(microsecond=0)
+            if slot not in slots:
+                continue  # instance déplacée: conservée comme événement à part
+            same = (all(getattr(instance, f) == getattr(parent, f) for f in fields)
+                    and instance.end_time - instance.start_time == duration)
+            (unchanged if same else overridden).append((instance.id, slot))
+        
+        if unchanged:
+            connection.execute(delete(table).where(table.c.id.in_([i for i, _ in unchanged])))
+        for instance_id, slot in overridden:
+            connection.execute(update(table).where(table.c.id == instance_id).values(recurrence_id=slot))
+        kept = {slot for _, slot in unchanged}
+        connection.execute(update(table).where(table.c.id == parent.id).values(
+            start_time=start,
+            end_time=start + duration,
+            rrule=f'{legacy_rules[parent.recurrence_type]};UNTIL={last.strftime(EXDATE_FORMAT)}',
+            exdates=format_exdates([s for s in slots if s not in kept]),
+            recurrence_end=last + duration,
+            sequence=1
+        ))
+    return len(parents)
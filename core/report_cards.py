@@ -0,0 +1,184 @@
+"""Génération des bulletins de notes d'un groupe
+
+Toutes les notes du groupe pour le trimestre sont lues en une requête, puis
+les bulletins (HTML et/ou CSV, un par élève) sont rendus dans un pool de
+processus pour utiliser tous les cœurs, et écrits au fil de l'eau dans une
+archive zip placée dans ``REPORTS_FOLDER``. La génération est lancée comme
+tâche de fond (core/jobs.py) et sa progression suivie par bulletin rendu.
+
+Le rendu ne dépend que de la bibliothèque standard: les fonctions
+``render_card`` et ``_render_chunk`` sont exécutées dans les processus fils.
+"""
+import csv
+import html
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.utils import secure_filename
+from sqlalchemy import and_, select
+from sqlalchemy.orm import aliased
+from core.extensions import db
+from core.models import User, Group, Note, user_groups
+from core.grade_aggregates import term_bounds
+
+FORMATS = ('html', 'csv')
+
+
+def fetch_group_cards(group_id, term):
+    """Données des bulletins des élèves du groupe (une requête)"""
+    start, end = term_bounds(term)
+    teacher = aliased(User)
+    group = db.session.get(Group, group_id)
+    
+    rows = db.session.execute(
+        select(User.id, User.username, Note.subject, Note.value, Note.max_value,
+               Note.comment, Note.created_at, teacher.username)
+        .join(user_groups, user_groups.c.user_id == User.id)
+        .outerjoin(Note, and_(Note.student_id == User.id,
+                              Note.created_at >= start,
+                              Note.created_at < end))
+        .outerjoin(teacher, teacher.id == Note.teacher_id)
+        .where(user_groups.c.group_id == group_id, User.role == 'eleve')
+        .order_by(User.username, User.id, Note.subject, Note.created_at)
+    ).all()
+    
+    cards = {}
+    class_scores = defaultdict(list)
+    for student_id, username, subject, value, max_value, comment, created_at, teacher_name in rows:
+        card = cards.setdefault(student_id, {
+            'student_id': student_id,
+            'student': username,
+            'group': group.name if group else None,
+            'term': term,
+            'notes': []
+        })
+        if subject is None or not max_value:
+            continue
+        card['notes'].append({
+            'subject': subject,
+            'value': value,
+            'max_value': max_value,
+            'comment': comment,
+            'date': created_at.date().isoformat() if created_at else None,
+            'teacher': teacher_name
+        })
+        class_scores[subject].append(20 * value / max_value)
+    
+    # Moyenne de la classe par matière, affichée sur chaque bulletin
+    class_averages = {s: round(sum(v) / len(v), 2) for s, v in class_scores.items()}
+    for card in cards.values():
+        card['class_averages'] = class_averages
+    return list(cards.values())
+
+
+def _subject_averages(card):
+    """Moyenne sur 20 de l'élève par matière"""
+    scores = defaultdict(list)
+    for note in card['notes']:
+        scores[note['subject']].append(20 * note['value'] / note['max_value'])
+    return {s: round(sum(v) / len(v), 2) for s, v in sorted(scores.items())}
+
+
+def esc(value):
+    """Échappement HTML (None -> chaîne vide)"""
+    return html.escape('' if value is None else str(value))
+
+
+def _render_html(card, averages):
+    summary = ''.join(
+        f'<tr><td>{esc(subject)}</td><td>{average:.2f}</td>'
+        f'<td>{esc(card["class_averages"].get(subject))}</td></tr>'
+        for subject, average in averages.items()
+    )
+    details = ''.join(
+        f'<tr><td>{esc(n["date"])}</td><td>{esc(n["subject"])}</td>'
+        f'<td>{esc(n["value"])} / {esc(n["max_value"])}</td>'
+        f'<td>{esc(n["teacher"])}</td><td>{esc(n["comment"])}</td></tr>'
+        for n in card['notes']
+    )
+    general = f'{sum(averages.values()) / len(averages):.2f}' if averages else '-'
+    return (
+        '<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8">'
+        f'<title>Bulletin - {esc(card["student"])}</title>'
+        '<style>body{font-family:sans-serif}table{border-collapse:collapse;margin-bottom:1em}'
+        'td,th{border:1px solid #999;padding:4px 8px}</style></head><body>'
+        f'<h1>Bulletin {esc(card["term"])}</h1>'
+        f'<p>Élève : <strong>{esc(card["student"])}</strong> - Groupe : {esc(card["group"])}</p>'
+        '<h2>Moyennes</h2><table><tr><th>Matière</th><th>Moyenne</th><th>Classe</th></tr>'
+        f'{summary}</table><p>Moyenne générale : <strong>{general}</strong></p>'
+        '<h2>Détail des notes</h2><table><tr><th>Date</th><th>Matière</th><th>Note</th>'
+        f'<th>Professeur</th><th>Commentaire</th></tr>{details}</table></body></html>'
+    )
+
+
+def _render_csv(card, averages):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['student', 'group', 'term', 'subject', 'date', 'value', 'max_value', 'teacher', 'comment'])
+    for n in card['notes']:
+        writer.writerow([card['student'], card['group'], card['term'], n['subject'], n['date'],
+                         n['value'], n['max_value'], n['teacher'], n['comment']])
+    for subject, average in averages.items():
+        writer.writerow([card['student'], card['group'], card['term'], subject, 'average', average, 20, '', ''])
+    return out.getvalue()
+
+
+def render_card(card, formats):
+    """Rend le bulletin d'un élève: liste de (nom de fichier, contenu)"""
+    averages = _subject_averages(card)
+    # Nom d'entrée sans séparateur ni « .. »: le nom d'utilisateur n'est pas un chemin sûr
+    base = f'{secure_filename(card["student"]) or "eleve"}_{card["student_id"]}'
+    files = []
+    if 'html' in formats:
+        files.append((f'html/{base}.html', _render_html(card, averages)))
+    if 'csv' in formats:
+        files.append((f'csv/{base}.csv', _render_csv(card, averages)))
+    return files
+
+
+def _render_chunk(cards, formats):
+    return [render_card(card, formats) for card in cards]
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def generate_report_cards(job, group_id, term, formats):
+    """Tâche de fond: bulletins du groupe dans une archive zip"""
+    config = current_app.config
+    cards = fetch_group_cards(group_id, term)
+    job.progress(0, len(cards))
+    
+    folder = config['REPORTS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    # term est validé par term_bounds (fetch_group_cards); le nom reste un simple nom de fichier
+    path = os.path.join(folder, secure_filename(f'report_cards_{int(group_id)}_{term}_{job.id}.zip'))
+    workers = config.get('REPORT_CARD_WORKERS') or os.cpu_count() or 1
+    chunk_size = config.get('REPORT_CARD_CHUNK_SIZE', 20)
+    chunks = list(_chunks(cards, chunk_size))
+    
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        def write(rendered_chunk):
+            for files in rendered_chunk:
+                for name, content in files:
+                    archive.writestr(name, content)
+            job.progress(job.done + len(rendered_chunk))
+        
+        if workers > 1 and len(chunks) > 1:
+            # spawn: le processus parent est multi-thread (serveur, pool de tâches)
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+                for rendered_chunk in pool.map(_render_chunk, chunks, [formats] * len(chunks)):
+                    write(rendered_chunk)
+        else:
+            for chunk in chunks:
+                write(_render_chunk(chunk, formats))
+    
+    job.result_path = path
+    return {'group_id': group_id, 'term': term, 'cards': len(cards), 'formats': list(formats)}
@@ -0,0 +1,86 @@
+"""Réponses en flux pour les grandes collections
+
+Deux formats sont proposés:
+- NDJSON (``Accept: application/x-ndjson``): un objet JSON par ligne;
+- tableau JSON découpé en morceaux (``?stream=1``): même document que la
+  réponse classique ``{"<clé>": [...]}``, envoyé au fur et à mesure.
+
+Les lignes sont lues par lots (``yield_per``) et sérialisées une à une: la
+mémoire consommée ne dépend pas de la taille de la table.
+
+Les exports CSV (``stream_csv``) lisent directement les lignes d'une requête
+Core avec un curseur côté serveur, sans construire d'objets ORM.
+"""
+import csv
+import io
+from flask import Response, current_app, request, stream_with_context
+from core.extensions import db
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def stream_mode():
+    """Format de flux demandé par le client ('ndjson', 'json' ou None)"""
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    if best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    if request.args.get('stream', type=int):
+        return 'json'
+    return None
+
+
+def _batched(rows, serialize, batch_size):
+    """Sérialise les lignes et les regroupe en morceaux de batch_size objets"""
+    dumps = current_app.json.dumps
+    chunk = []
+    for row in rows:
+        chunk.append(dumps(serialize(row)))
+        if len(chunk) >= batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_query(query, serialize, key, mode):
+    """Réponse en flux pour une requête ORM, sérialisée ligne par ligne"""
+    batch_size = current_app.config.get('STREAM_BATCH_SIZE', 500)
+    rows = query.yield_per(batch_size)
+
+    if mode == 'ndjson':
+        def generate():
+            for chunk in _batched(rows, serialize, batch_size):
+                yield '\n'.join(chunk) + '\n'
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        yield '{"%s": [' % key
+        separator = ''
+        for chunk in _batched(rows, serialize, batch_size):
+            yield separator + ','.join(chunk)
+            separator = ','
+        yield ']}\n'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def stream_csv(statement, header, serialize, filename):
+    """Export CSV en flux d'une requête Core, lue par lots avec un curseur côté serveur"""
+    batch_size = current_app.config.get('STREAM_BATCH_SIZE', 500)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        yield buffer.getvalue()
+        
+        result = db.session.execute(
+            statement, execution_options={'stream_results': True, 'yield_per': batch_size}
+        )
+        for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(serialize(row) for row in rows)
+            yield buffer.getvalue()
+    
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
@@ -0,0 +1,142 @@
+"""Abonnements à des calendriers .ics publiés
+
+Chaque abonnement rattache une URL (ENT, Google Agenda, Pronote...) à un
+groupe. Le flux est téléchargé en requête conditionnelle (``If-None-Match``
+avec l'ETag et ``If-Modified-Since`` avec la date renvoyés au téléchargement
+précédent): un flux inchangé (304) n'est ni transféré ni analysé. Sinon il
+est importé en flux par ``IcsImporter``, qui n'écrit que les événements
+ajoutés ou modifiés et supprime ceux retirés du flux.
+
+Le planificateur est un thread du processus qui vérifie toutes les
+``CALENDAR_SYNC_POLL_SECONDS`` les abonnements dont l'intervalle est écoulé.
+Il n'est démarré que si ``CALENDAR_SYNC_ENABLED`` est activé: à activer sur
+un seul processus lorsque l'application en compte plusieurs.
+"""
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from flask import current_app
+from core.extensions import db
+from core.models import CalendarSubscription
+from core.ics_import import IcsImporter
+
+SCHEMES = ('http', 'https')
+
+# Fonctions appelées avec le groupe d'un abonnement modifié (invalidation du cache)
+_change_listeners = []
+
+
+def on_change(fn):
+    """Enregistre une fonction appelée après chaque synchronisation qui modifie un groupe"""
+    _change_listeners.append(fn)
+    return fn
+
+
+def validate_url(url):
+    """Vérifie qu'une URL d'abonnement est en http(s) (ValueError sinon)"""
+    parsed = urlparse(url or '')
+    if parsed.scheme not in SCHEMES or not parsed.netloc:
+        raise ValueError('Subscription URL must be http or https')
+    return url
+
+
+def _request(subscription):
+    """Requête conditionnelle avec les validateurs du dernier téléchargement"""
+    headers = {'Accept': 'text/calendar', 'User-Agent': 'OpenDirecte calendar sync'}
+    if subscription.etag:
+        headers['If-None-Match'] = subscription.etag
+    if subscription.last_modified:
+        headers['If-Modified-Since'] = subscription.last_modified
+    return urllib.request.Request(subscription.url, headers=headers)
+
+
+def sync_subscription(subscription):
+    """Synchronise un abonnement; renvoie le statut et les compteurs de l'import"""
+    config = current_app.config
+    result = {'status': 'not_modified'}
+    try:
+        validate_url(subscription.url)
+        importer = IcsImporter(subscription.group_id, config.get('ICS_IMPORT_BATCH_SIZE', 500),
+                               subscription_id=subscription.id)
+        try:
+            with urllib.request.urlopen(_request(subscription),
+                                        timeout=config.get('CALENDAR_SYNC_TIMEOUT', 30)) as response:
+                counts = importer.run(response)
+                etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            subscription.etag = etag[:255] if etag else None
+            subscription.last_modified = last_modified[:64] if last_modified else None
+            result = {'status': 'updated', **counts}
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+        subscription.last_error = None
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning('Calendar subscription %s failed: %s', subscription.id, e)
+        subscription.last_error = str(e)[:1000]
+        result = {'status': 'error', 'error': subscription.last_error}
+    
+    subscription.last_status = result['status']
+    subscription.last_synced_at = datetime.utcnow()
+    db.session.commit()
+    if result['status'] == 'updated':
+        for listener in _change_listeners:
+            listener(subscription.group_id)
+    return result
+
+
+def due_subscriptions(now=None):
+    """Abonnements actifs dont l'intervalle de synchronisation est écoulé"""
+    now = now or datetime.utcnow()
+    return [
+        s for s in CalendarSubscription.query.filter_by(enabled=True).order_by(CalendarSubscription.id)
+        if s.last_synced_at is None or now - s.last_synced_at >= timedelta(minutes=s.interval_minutes)
+    ]
+
+
+class SubscriptionScheduler:
+    """Synchronisation périodique des abonnements (thread du processus)"""
+    
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+    
+    def init_app(self, app):
+        """Démarre le planificateur si CALENDAR_SYNC_ENABLED est activé"""
+        if not app.config.get('CALENDAR_SYNC_ENABLED') or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(app,), name='calendar-sync', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Arrête le planificateur"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def _loop(self, app):
+        poll = app.config.get('CALENDAR_SYNC_POLL_SECONDS', 60)
+        while not self._stop.wait(poll):
+            with app.app_context():
+                try:
+                    self.run_due()
+                except Exception:
+                    app.logger.exception('Calendar subscription sync failed')
+                finally:
+                    db.session.remove()
+    
+    def run_due(self):
+        """Synchronise les abonnements échus; renvoie le nombre d'abonnements traités"""
+        subscriptions = due_subscriptions()
+        for subscription in subscriptions:
+            if self._stop.is_set():
+                break
+            sync_subscription(subscription)
+        return len(subscriptions)
+
+
+subscription_scheduler = SubscriptionScheduler()
@@ -0,0 +1,167 @@
+"""Regroupement des petites écritures fréquentes (group commit)
+
+Certaines écritures ne modifient qu'une ligne et sont idempotentes (cocher
+un devoir, marquer un message comme lu). Exécutées une par une, chacune
+coûte une transaction complète et une synchronisation disque, et SQLite les
+sérialise. Lorsque ``WRITE_BATCHING_ENABLED`` est actif, ces instructions
+sont confiées à un thread d'écriture unique qui les accumule pendant
+``WRITE_BATCH_WINDOW_MS`` millisecondes puis les valide dans une seule
+transaction. L'appelant attend la fin du commit: au retour, l'écriture est
+durable.
+
+Si la transaction groupée échoue, les instructions sont rejouées une par une
+afin que seule l'instruction fautive renvoie une erreur à son appelant.
+Désactivé, ``submit`` exécute l'instruction dans la session courante et
+valide immédiatement.
+
+L'appelant n'attend pas plus de ``WRITE_BATCH_TIMEOUT`` secondes qu'une
+écriture soit prise par le thread: au-delà (thread bloqué ou arrêté),
+l'écriture est annulée et la requête reçoit une réponse 503. Une écriture
+déjà prise par le thread est attendue jusqu'à son commit (ou son erreur).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from flask import abort, current_app, jsonify, make_response
+from core.extensions import db
+
+
+class WriteBatcher:
+    """Thread d'écriture unique qui valide les instructions par lots"""
+    
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._engine = None
+        self._window = 0.005
+        self._max_batch = 500
+        self._metrics = {
+            'batches': 0,
+            'writes': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'max_batch_size': 0,
+            'total_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'last_commit_ms': 0.0
+        }
+    
+    def enabled(self):
+        """Le regroupement des écritures est-il actif ?"""
+        return current_app.config.get('WRITE_BATCHING_ENABLED', False)
+    
+    def submit(self, *statements):
+        """Exécute les instructions et attend qu'elles soient validées"""
+        if not self.enabled():
+            for statement in statements:
+                db.session.execute(statement)
+            db.session.commit()
+            return
+        
+        self._ensure_started()
+        future = Future()
+        self._queue.put((statements, future))
+        try:
+            future.result(timeout=current_app.config.get('WRITE_BATCH_TIMEOUT', 10))
+        except TimeoutError:
+            if not future.cancel():
+                # Déjà prise par le thread: elle sera validée, attendre son résultat
+                future.result()
+                return
+            # Annulée avant exécution: l'écriture n'aura pas lieu
+            with self._lock:
+                self._metrics['timeouts'] += 1
+            abort(make_response(jsonify({'error': 'Write queue unavailable, try again later'}), 503))
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # (Re)démarrer le thread s'il n'existe pas ou s'est arrêté
+            if self._thread is None or not self._thread.is_alive():
+                config = current_app.config
+                self._engine = db.engine
+                self._window = config.get('WRITE_BATCH_WINDOW_MS', 5) / 1000.0
+                self._max_batch = config.get('WRITE_BATCH_MAX_SIZE', 500)
+                self._thread = threading.Thread(target=self._run, name='write-batcher', daemon=True)
+                self._thread.start()
+    
+    def _collect(self):
+        """Attend une écriture puis accumule les suivantes pendant la fenêtre"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Les écritures abandonnées par leur appelant (délai dépassé) sont ignorées
+        return [item for item in batch if item[1].set_running_or_notify_cancel()]
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                with self._engine.begin() as connection:
+                    for statements, _ in batch:
+                        for statement in statements:
+                            connection.execute(statement)
+            except Exception:
+                # Rejouer individuellement pour isoler l'instruction fautive
+                self._run_one_by_one(batch)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+            self._record(len(batch), (time.perf_counter() - started) * 1000)
+    
+    def _run_one_by_one(self, batch):
+        for statements, future in batch:
+            try:
+                with self._engine.begin() as connection:
+                    for statement in statements:
+                        connection.execute(statement)
+            except Exception as e:
+                with self._lock:
+                    self._metrics['errors'] += 1
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+    
+    def _record(self, size, elapsed_ms):
+        with self._lock:
+            metrics = self._metrics
+            metrics['batches'] += 1
+            metrics['writes'] += size
+            metrics['max_batch_size'] = max(metrics['max_batch_size'], size)
+            metrics['total_commit_ms'] += elapsed_ms
+            metrics['max_commit_ms'] = max(metrics['max_commit_ms'], elapsed_ms)
+            metrics['last_commit_ms'] = elapsed_ms
+    
+    def metrics(self):
+        """Statistiques des lots (taille, latence de commit)"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        batches = metrics.pop('batches')
+        total_commit_ms = metrics.pop('total_commit_ms')
+        for key in ('max_commit_ms', 'last_commit_ms'):
+            metrics[key] = round(metrics[key], 3)
+        return {
+            'enabled': self.enabled(),
+            'window_ms': current_app.config.get('WRITE_BATCH_WINDOW_MS', 5),
+            'pending': self._queue.qsize(),
+            'batches': batches,
+            'avg_batch_size': round(metrics['writes'] / batches, 2) if batches else 0,
+            'avg_commit_ms': round(total_commit_ms / batches, 3) if batches else 0,
+            **metrics
+        }
+
+
+write_batcher = WriteBatcher()
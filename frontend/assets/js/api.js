@@ -56,6 +56,15 @@ function checkAuth() {
 
 // Déconnexion
 function logout() {
+    const token = getToken();
+    if (token) {
+        // Révoquer le token côté serveur sans attendre la réponse
+        fetch(`${API_BASE}/auth/logout`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${token}` },
+            keepalive: true
+        });
+    }
     removeToken();
     window.location.href = '/';
 }
@@ -253,7 +253,7 @@ function renderEventCard(event) {
     const heightClass = duration > 60 ? 'min-h-[120px]' : 'min-h-[60px]';
     
     return `
-        <div class="mb-1 p-2 rounded-lg border-l-4 ${isPast ? 'bg-gray-100 border-gray-400' : 'bg-orange-50 border-orange-500'} ${heightClass} hover:shadow-md transition-shadow cursor-pointer" onclick="viewEventDetails(${event.id})">
+        <div class="mb-1 p-2 rounded-lg border-l-4 ${isPast ? 'bg-gray-100 border-gray-400' : 'bg-orange-50 border-orange-500'} ${heightClass} hover:shadow-md transition-shadow cursor-pointer" onclick="viewEventDetails(${allEvents.indexOf(event)})">
             <div class="font-semibold text-sm text-gray-800 mb-1">${escapeHtml(event.title)}</div>
             <div class="text-xs text-gray-600">
                 ${startDate.toLocaleTimeString('fr-FR', { hour: '2-digit', minute: '2-digit' })}
@@ -261,14 +261,15 @@ function renderEventCard(event) {
             </div>
             ${event.location ? `<div class="text-xs text-gray-600 mt-1">📍 ${escapeHtml(event.location)}</div>` : ''}
             ${event.group_name ? `<div class="text-xs text-gray-500 mt-1">${escapeHtml(event.group_name)}</div>` : ''}
-            ${event.parent_event_id ? '<div class="text-xs text-orange-600 mt-1">🔁 Récurrent</div>' : ''}
+            ${event.parent_event_id || event.rrule ? '<div class="text-xs text-orange-600 mt-1">🔁 Récurrent</div>' : ''}
         </div>
     `;
 }
 
 // Voir les détails d'un événement
-function viewEventDetails(eventId) {
-    const event = allEvents.find(e => e.id === eventId);
+// (les occurrences d'une série partagent le même id: l'événement est désigné par son index)
+function viewEventDetails(eventIndex) {
+    const event = allEvents[eventIndex];
     if (!event) return;
     
     const startDate = new Date(event.start_time);
@@ -328,7 +329,7 @@ function viewEventDetails(eventId) {
                         Fermer
                     </button>
                     ${canDelete ? `
-                    <button onclick="deleteCourse(${event.id}, ${event.is_recurring || event.parent_event_id})" class="px-4 py-2 bg-red-500 hover:bg-red-600 text-white rounded-lg font-medium transition-colors">
+                    <button onclick="deleteCourse(${event.id}, ${Boolean(event.is_recurring || event.parent_event_id)}, ${event.rrule ? `'${event.recurrence_id}'` : 'null'})" class="px-4 py-2 bg-red-500 hover:bg-red-600 text-white rounded-lg font-medium transition-colors">
                         Supprimer
                     </button>` : ''}
                 </div>
@@ -457,7 +458,7 @@ document.getElementById('courseForm').addEventListener('submit', async function(
 });
 
 // Supprimer un cours
-async function deleteCourse(eventId, isRecurring) {
+async function deleteCourse(eventId, isRecurring, occurrence = null) {
     let deleteSeries = false;
     
     if (isRecurring) {
@@ -477,7 +478,7 @@ async function deleteCourse(eventId, isRecurring) {
                 'Authorization': `Bearer ${token}`,
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ delete_series: deleteSeries })
+            body: JSON.stringify({ delete_series: deleteSeries, occurrence })
         });
         
         const result = await response.json();